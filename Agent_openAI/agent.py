@@ -2,38 +2,28 @@
 
 import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from contextlib import AsyncExitStack
 
-from sys import api_version
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List
 
-from httpx import stream
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from utils.history_util import MessageHistory
 from tools.base import Tool
 from utils.tool_util import execute_tools
-from utils.connection import setup_mcp_connections
+from utils.connection import get_mcp_manager, close_mcp_manager
+from utils.client_util import get_shared_client, close_shared_client
+from utils.stream_util import ToolCallAssembler
+from utils.telemetry import Tracer, get_tracer, preview, record_model_call
+from utils.session_store import SessionManager, SessionStore
+from utils.tokenizer_util import warm_tokenizer
 
 from tools.fake_get_weather import FakeGetWeather
 
 from loguru import logger
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-api_key = os.getenv("OPENAI_API_KEY")
-api_version = os.getenv("OPENAI_API_VERSION")
-api_base = os.getenv("OPENAI_API_BASE")
-
-client = OpenAI(
-    api_key=api_key,
-    api_version=api_version,
-    base_url=api_base,
-)
-
 @dataclass
 class ModelConfig:
     """Model configuration for the agent"""
@@ -42,6 +32,10 @@ class ModelConfig:
     max_tokens: int = 4096
     temperature: float = 0.7
     context_window_tokens: int = 8192
+    # Summarize old turns in the background instead of dropping them
+    compaction: bool = False
+    summary_budget_tokens: int = 512
+    recent_budget_tokens: int | None = None
     
 class Agent:
     """Agent class for the agent framework"""
@@ -54,8 +48,11 @@ class Agent:
         mcp_servers: List[Dict[str, Any]] | None = None,
         tools: List[Tool] | None = None,
         config: ModelConfig | None = None,
-        client: OpenAI | None = None,
+        client: AsyncOpenAI | None = None,
         history: MessageHistory | None = None,
+        tracer: Tracer | None = None,
+        session_store: SessionStore | None = None,
+        max_sessions: int = 1000,
     ):  
         
         self.name = name
@@ -64,26 +61,53 @@ class Agent:
         self.verbose = verbose
         self.mcp_servers = mcp_servers or []
         self.tools = list(tools or [])
-        self.client = client or OpenAI(
-            api_key=api_key,
-            api_version=api_version,
-            base_url=api_base,
-        )
-        self.history = history or MessageHistory(
+        # None means the process-wide pooled client of the running event loop
+        self._client = client
+        # Request prefix kept byte-stable between calls so provider prompt caching hits
+        self._system_message = {
+            "role": "system",
+            "content": self.system,
+        }
+        self._tool_params: Dict[tuple, List[Dict[str, Any]]] = {}
+        self.tracer = tracer or get_tracer()
+        self.history = history or self._new_history()
+        # With a store, runs given a session_id use that session's persisted history
+        self.sessions = SessionManager(session_store, self._new_history, max_sessions) if session_store else None
+
+    def _new_history(self) -> MessageHistory:
+        return MessageHistory(
             model=self.config.model,
-            system=system,
+            system=self.system,
             context_window_tokens=self.config.context_window_tokens,
-            client=self.client, # May not be needed
+            client=self._client, # Used for compaction summaries
+            compaction=self.config.compaction,
+            summary_budget_tokens=self.config.summary_budget_tokens,
+            recent_budget_tokens=self.config.recent_budget_tokens,
         )
+
+    @asynccontextmanager
+    async def _history_for(self, session_id: str | None) -> AsyncIterator[MessageHistory]:
+        """History of the session, or the agent's own history without a session
+
+        A session history stays in memory while the block runs
+        """
+        if session_id is None:
+            yield self.history
+            return
+        if self.sessions is None:
+            raise ValueError("session_id requires the agent to be created with a session_store")
+        async with self.sessions.use(session_id) as history:
+            yield history
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Async client used for model calls, shared across agents unless one was given"""
+        return self._client or get_shared_client()
         
-    def _prepare_message_params(self) -> Dict[str, Any]:
+    def _prepare_message_params(self, tools: List[Tool], history: MessageHistory) -> Dict[str, Any]:
         """Prepare the message parameters for the OpenAI ChatCompletion API"""
         
-        messages = self.history.format_for_api()
-        messages.insert(0, {
-            "role": "system",
-            "content": self.system,
-        })
+        messages = [self._system_message, *history.format_for_api()]
         
         result = {
             "model": self.config.model,
@@ -92,59 +116,212 @@ class Agent:
             "temperature": self.config.temperature,
         }
         
-        if self.tools:
-            result["tools"] = [tool.to_dict() for tool in self.tools]
+        if tools:
+            result["tools"] = self._tool_params_for(tools)
             
         return result
 
-    async def _agent_loop(self, user_input: str) -> List[Dict[str, Any]]:
+    def _tool_params_for(self, tools: List[Tool]) -> List[Dict[str, Any]]:
+        """Serialized tool list, reused as long as the same tools are offered"""
+        key = tuple(tool.name for tool in tools)
+        
+        if key not in self._tool_params:
+            self._tool_params[key] = [tool.to_dict() for tool in tools]
+        
+        return self._tool_params[key]
+
+    async def _agent_loop(self, user_input: str, tools: List[Tool], history: MessageHistory) -> List[Dict[str, Any]]:
         "Process user input and handole tool calls in a loop"
         
-        logger.info(f"{self.name}: Received {user_input}")
+        logger.info("{}: Received {}", self.name, preview(user_input))
             
-        tool_dict = {tool.name: tool for tool in self.tools}
+        tool_dict = {tool.name: tool for tool in tools}
         
-        await self.history.add_message("user", user_input)
+        await history.add_message("user", user_input)
         
         while True:
-            self.history.truncate()
+            history.truncate(reserve_tokens=self.config.max_tokens)
             
-            params = self._prepare_message_params()
+            params = self._prepare_message_params(tools, history)
             
+            started = time.perf_counter()
             response = await self.client.chat.completions.create(**params)
+            record_model_call(time.perf_counter() - started, response.usage)
             
-            logger.info(f"{self.name}: Response: {response.choices[0].message.content}")
+            logger.info("{}: Response: {}", self.name, preview(response.choices[0].message.content))
             
             if response.choices[0].message.tool_calls:
-                await self.history.add_message("assistant", response.choices[0].message,response.usage)
+                await history.add_message("assistant", response.choices[0].message,response.usage)
                 
                 tool_calls = response.choices[0].message.tool_calls
                 tool_results = await execute_tools(tool_calls, tool_dict)
                 
                 for tool_result in tool_results:
-                    await self.history.add_message("tool", tool_result)
+                    await history.add_message("tool", tool_result)
                     
             else:
-                await self.history.add_message("assistant", response.choices[0].message.content, response.usage)
+                await history.add_message("assistant", response.choices[0].message.content, response.usage)
+                history.schedule_compaction()
                 
                 return response.choices[0].message.content
+
+    async def _agent_loop_stream(self, user_input: str, tools: List[Tool], history: MessageHistory) -> AsyncIterator[str]:
+        """Streaming version of the agent loop
+        
+        Text tokens are yielded as they arrive. Each tool call is dispatched as soon as
+        its arguments are complete, while the model is still streaming the rest
+        """
+        
+        logger.info("{}: Received {}", self.name, preview(user_input))
+        
+        tool_dict = {tool.name: tool for tool in tools}
+        
+        await history.add_message("user", user_input)
+        
+        while True:
+            history.truncate(reserve_tokens=self.config.max_tokens)
+            
+            params = self._prepare_message_params(tools, history)
             
-    async def run_async(self, user_input: str) -> List[Dict[str, Any]]:
-        """Run the agent asynchronously with MCP tools (Not implemented yet)"""
-        # Would need to extend our tool set
-        tools = list(self.tools)
-        async with AsyncExitStack() as stack:
+            started = time.perf_counter()
+            ttft = None
+            stream = await self.client.chat.completions.create(
+                **params,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            
+            assembler = ToolCallAssembler()
+            tool_tasks: Dict[int, asyncio.Task] = {}
+            content_parts: List[str] = []
+            usage = None
+            
+            def dispatch(calls):
+                for call in calls:
+                    tool_tasks[call.index] = asyncio.create_task(execute_tools([call], tool_dict))
+            
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    
+                    delta = chunk.choices[0].delta
+                    if ttft is None and (delta.content or delta.tool_calls):
+                        ttft = time.perf_counter() - started
+                    if delta.content:
+                        content_parts.append(delta.content)
+                        yield delta.content
+                    
+                    dispatch(assembler.feed(delta.tool_calls))
+                
+                dispatch(assembler.finish())
+                record_model_call(time.perf_counter() - started, usage, ttft)
+                
+                content = "".join(content_parts)
+                logger.info("{}: Response: {}", self.name, preview(content))
+                
+                tool_calls = assembler.ordered_calls()
+                if not tool_calls:
+                    await history.add_message("assistant", content, usage)
+                    history.schedule_compaction()
+                    return
+                
+                await history.add_message("assistant", {
+                    "role": "assistant",
+                    "content": content or None,
+                    "tool_calls": [call.to_dict() for call in tool_calls],
+                }, usage)
+                
+                # Results go to history in call order, whatever order they finished in
+                for call in tool_calls:
+                    for tool_result in await tool_tasks[call.index]:
+                        await history.add_message("tool", tool_result)
+            finally:
+                # Consumer stopped early or the stream failed, don't leave tools running
+                for task in tool_tasks.values():
+                    task.cancel()
+            
+    async def run_async(self, user_input: str, session_id: str | None = None) -> List[Dict[str, Any]]:
+        """Run the agent asynchronously with MCP tools
+        
+        The tool set is local to the run, so many agents (one per conversation)
+        can run concurrently on the same event loop and share the pooled client.
+        MCP servers are kept alive across runs by the process-wide connection manager.
+        With a session store, one agent can serve many conversations by session_id
+        """
+        # Session histories count their system prompt when they are loaded
+        await warm_tokenizer(self.config.model)
+        with self.tracer.turn(self.name):
+            async with self._history_for(session_id) as history:
+                mcp_tools = await get_mcp_manager().get_tools(self.mcp_servers)
+                return await self._agent_loop(user_input, self.tools + mcp_tools, history)
+
+    async def stream_async(self, user_input: str, session_id: str | None = None) -> AsyncIterator[str]:
+        """Run the agent asynchronously and yield assistant text tokens as they arrive
+
+        The turn runs in its own task and tokens are passed through a queue, so the
+        turn span never leaks into the consumer's context across yields and the
+        generator can be closed from any task. Stopping early cancels the turn
+        """
+        tokens: asyncio.Queue = asyncio.Queue()
+        end = object()
+        stopped = False
+
+        async def produce() -> None:
             try:
-                mcp_tools = await setup_mcp_connections(self.mcp_servers, stack)
-                self.tools.extend(mcp_tools)
-                return await self._agent_loop(user_input)
+                await warm_tokenizer(self.config.model)
+                with self.tracer.turn(self.name):
+                    async with self._history_for(session_id) as history:
+                        mcp_tools = await get_mcp_manager().get_tools(self.mcp_servers)
+                        try:
+                            async for token in self._agent_loop_stream(user_input, self.tools + mcp_tools, history):
+                                tokens.put_nowait(token)
+                        except asyncio.CancelledError:
+                            # Streaming consumer stopped early, not an error
+                            if not stopped:
+                                raise
             finally:
-                self.tools = tools
+                tokens.put_nowait(end)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (token := await tokens.get()) is not end:
+                yield token
+            await producer
+        finally:
+            if not producer.done():
+                stopped = True
+                producer.cancel()
+                producer.add_done_callback(lambda task: task.cancelled() or task.exception())
 
-    async def run(self, user_input: str) -> List[Dict[str, Any]]:
+    def run(self, user_input: str, session_id: str | None = None) -> List[Dict[str, Any]]:
         """Run the agent synchronously"""
         
-        return asyncio.run(self.run_async(user_input))
+        async def _run() -> List[Dict[str, Any]]:
+            try:
+                result = await self.run_async(user_input, session_id)
+                async with self._history_for(session_id) as history:
+                    await history.wait_for_compaction()
+                if self.sessions is not None:
+                    await asyncio.to_thread(self.sessions.store.flush)
+                await asyncio.to_thread(self.tracer.flush)
+                return result
+            finally:
+                # The loop is closed by asyncio.run, so release its pooled connections
+                await close_mcp_manager()
+                await close_shared_client()
+
+        return asyncio.run(_run())
+
+
+async def run_sessions(agents: List[Agent], user_inputs: List[str]) -> List[Any]:
+    """Run one turn for many agents (one per conversation) concurrently"""
+    return await asyncio.gather(
+        *[agent.run_async(user_input) for agent, user_input in zip(agents, user_inputs)],
+        return_exceptions=True,
+    )
     
 
 if __name__ == "__main__":
@@ -155,7 +332,7 @@ if __name__ == "__main__":
         "args": [calculator_server_path],
     }
     
-    print(f"Loaded MCP tools: {"Yes" if calculator_server else "No"}")
+    print(f"Loaded MCP tools: {'Yes' if calculator_server else 'No'}")
     
     agent = Agent(
         name="Two tools Agent",
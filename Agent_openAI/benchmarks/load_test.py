@@ -0,0 +1,240 @@
+"""Offline load test for Agent against the mock OpenAI server
+
+Runs N concurrent sessions through Agent.run_async (or stream_async) and reports
+turn latency percentiles, throughput and event-loop lag. Everything runs locally,
+so it can be used in CI to put a number on every change to the loop, history or
+tool execution.
+
+Usage (from Agent_openAI):
+    python -m benchmarks.load_test --sessions 200 --turns 3
+    python -m benchmarks.load_test --stream --mcp --output report.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from agent import Agent, ModelConfig
+from tools.base import Tool
+from tools.fake_get_weather import FakeGetWeather
+from utils.client_util import PoolConfig, create_client
+from utils.connection import close_mcp_manager
+from utils.tokenizer_util import warm_tokenizer
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+from loguru import logger
+
+class LocalCalculator(Tool):
+    """In-process stand-in for the calculator MCP tool, used without --mcp"""
+
+    def __init__(self):
+        super().__init__(
+            name="calculator",
+            description="Perform basic calculator with two numbers",
+            input_schema={
+                "type": "object",
+                "properties": {
+                    "number1": {"type": "number"},
+                    "number2": {"type": "number"},
+                    "operation": {"type": "string"},
+                },
+                "required": ["number1", "number2", "operation"],
+            },
+        )
+
+    async def execute(self, number1: float, number2: float, operation: str) -> str:
+        operations = {
+            "+": lambda a, b: a + b,
+            "-": lambda a, b: a - b,
+            "*": lambda a, b: a * b,
+            "/": lambda a, b: a / b if b else float("nan"),
+        }
+        if operation not in operations:
+            return "Error: Invalid operation"
+        return f"Result: {operations[operation](number1, number2)}"
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a task sleeping for `interval`"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+def start_server_thread(script: Dict[str, Any] | None) -> MockOpenAIServer:
+    """Run the mock server on its own loop, so it doesn't load the measured loop"""
+    server = MockOpenAIServer(script)
+    ready = threading.Event()
+
+    def run() -> None:
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True, name="mock-openai").start()
+    ready.wait()
+    return server
+
+async def run_session(agent: Agent, turns: int, stream: bool, latencies: List[float], ttfts: List[float], errors: List[str]) -> None:
+    for turn in range(turns):
+        started = time.perf_counter()
+        try:
+            if stream:
+                first = None
+                async for _ in agent.stream_async(f"Question {turn}: weather in Tokyo and 3 * 4?"):
+                    if first is None:
+                        first = time.perf_counter() - started
+                if first is not None:
+                    ttfts.append(first)
+            else:
+                await agent.run_async(f"Question {turn}: weather in Tokyo and 3 * 4?")
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    server = start_server_thread(script)
+    client = create_client(
+        PoolConfig(max_connections=args.max_connections, max_keepalive_connections=args.max_connections),
+        base_url=server.base_url,
+        key="mock",
+    )
+
+    tools: List[Tool] = [FakeGetWeather()]
+    mcp_servers = []
+    if args.mcp:
+        mcp_servers.append({
+            "type": "stdio",
+            "command": sys.executable,
+            "args": [os.path.join(os.path.dirname(__file__), "mock_mcp_server.py")],
+        })
+    else:
+        tools.append(LocalCalculator())
+
+    if args.no_cache:
+        for tool in tools:
+            tool.cacheable = False
+
+    # Agents count their system prompt when created, load the encoding in a thread first
+    await warm_tokenizer("mock")
+    agents = [
+        Agent(
+            name=f"session-{i}",
+            system="You are a helpful assistant",
+            tools=tools,
+            mcp_servers=mcp_servers,
+            config=ModelConfig(model="mock"),
+            client=client,
+        )
+        for i in range(args.sessions)
+    ]
+
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors: List[str] = []
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(agent, args.turns, args.stream, latencies, ttfts, errors)
+        for agent in agents
+    ])
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+
+    await close_mcp_manager()
+    await client.close()
+
+    return {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "stream": args.stream,
+        "mcp": args.mcp,
+        "model_requests": server.requests,
+        "completed_turns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": elapsed,
+        "throughput_turns_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "turn_latency_s": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+        },
+        "ttft_s": {
+            "p50": percentile(ttfts, 50),
+            "p95": percentile(ttfts, 95),
+            "p99": percentile(ttfts, 99),
+        },
+        "loop_lag_s": {
+            "p50": percentile(monitor.lags, 50),
+            "p99": percentile(monitor.lags, 99),
+            "max": max(monitor.lags, default=0.0),
+        },
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for Agent")
+    parser.add_argument("--sessions", type=int, default=100, help="Concurrent sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--stream", action="store_true", help="Use stream_async instead of run_async")
+    parser.add_argument("--mcp", action="store_true", help="Use the local MCP stand-in over stdio")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the tool result cache")
+    parser.add_argument("--max-connections", type=int, default=100, help="HTTP pool size")
+    parser.add_argument("--script", help="JSON script for the mock server")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    # Per-message logs would dominate the measurement
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    report = asyncio.run(run_load(args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Local MCP stand-in for benchmarks
+
+Same calculator tool name and schema as tools/calculator_mcp.py, with a
+configurable delay (MOCK_MCP_LATENCY seconds) to mimic a real server
+"""
+
+import asyncio
+import os
+
+from mcp.server import FastMCP
+
+mcp = FastMCP("mock-calculator")
+
+LATENCY = float(os.getenv("MOCK_MCP_LATENCY", "0.01"))
+
+@mcp.tool(name="calculator")
+async def calculator(number1:float, number2:float, operation:str) -> str:
+    """Perform basic calculator with two numbers
+
+    Args:
+        number1 (float): First number in the calculation
+        number2 (float): Second number in the calculation
+        operation (str): Operation to perform (+ ,- , *, /)
+
+    Returns:
+        str: Result of the calculation
+    """
+    await asyncio.sleep(LATENCY)
+
+    operations = {
+        "+": lambda a, b: a + b,
+        "-": lambda a, b: a - b,
+        "*": lambda a, b: a * b,
+        "/": lambda a, b: a / b if b else float("nan"),
+    }
+    if operation not in operations:
+        return "Error: Invalid operation"
+    return f"Result: {operations[operation](number1, number2)}"
+
+if __name__ == "__main__":
+    mcp.run()
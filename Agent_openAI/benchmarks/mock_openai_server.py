@@ -0,0 +1,230 @@
+"""Local OpenAI-compatible server replaying scripted completions
+
+Only POST /chat/completions (and /v1/chat/completions) is implemented, with and
+without streaming, over HTTP/1.1 keep-alive. The step of the script is chosen from
+the number of assistant messages since the last user message, so every session
+replays the same tool calls and answer without any server-side state.
+
+Script format (JSON):
+{
+    "steps": [
+        {"tool_calls": [{"name": "get_weather", "arguments": {"city": "Tokyo"}}], "latency": 0.2},
+        {"content": "The weather in Tokyo is sunny", "latency": 0.3, "chunk_delay": 0.01}
+    ]
+}
+latency is the delay before the first byte, chunk_delay the delay between stream chunks.
+
+Run standalone with: python -m benchmarks.mock_openai_server --port 8011
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List
+
+DEFAULT_SCRIPT: Dict[str, Any] = {
+    "steps": [
+        {
+            "tool_calls": [
+                {"name": "get_weather", "arguments": {"city": "Tokyo"}},
+                {"name": "calculator", "arguments": {"number1": 3, "number2": 4, "operation": "*"}},
+            ],
+            "latency": 0.2,
+            "chunk_delay": 0.005,
+        },
+        {
+            "content": "The weather in Tokyo is sunny and 3 times 4 is 12.",
+            "latency": 0.3,
+            "chunk_delay": 0.01,
+        },
+    ]
+}
+
+def _words(text: str) -> List[str]:
+    """Split text in stream-sized pieces, keeping the spaces"""
+    pieces = text.split(" ")
+    return [piece + " " for piece in pieces[:-1]] + pieces[-1:]
+
+class MockOpenAIServer:
+    """Scripted OpenAI-compatible chat completion server"""
+
+    def __init__(self, script: Dict[str, Any] | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.script = script or DEFAULT_SCRIPT
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _step(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        steps = self.script["steps"]
+        index = 0
+        for message in reversed(messages):
+            if message["role"] == "user":
+                break
+            if message["role"] == "assistant":
+                index += 1
+        return steps[min(index, len(steps) - 1)]
+
+    @staticmethod
+    def _usage(body: Dict[str, Any], step: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = sum(len(str(message.get("content") or "")) for message in body["messages"]) // 4
+        completion = len(step.get("content", "")) // 4 + 10 * len(step.get("tool_calls", []))
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    @staticmethod
+    def _tool_calls(step: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+            }
+            for call in step.get("tool_calls", [])
+        ]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = json.loads(await reader.readexactly(int(headers.get("content-length", 0))) or b"{}")
+                method, path, _ = request_line.decode().split(" ", 2)
+
+                if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+                    continue
+
+                self.requests += 1
+                step = self._step(body["messages"])
+                await asyncio.sleep(step.get("latency", 0))
+
+                if body.get("stream"):
+                    await self._stream(writer, body, step)
+                else:
+                    await self._complete(writer, body, step)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _complete(self, writer: asyncio.StreamWriter, body: Dict[str, Any], step: Dict[str, Any]) -> None:
+        tool_calls = self._tool_calls(step)
+        message: Dict[str, Any] = {"role": "assistant", "content": step.get("content")}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": self._usage(body, step),
+        }).encode()
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, body: Dict[str, Any], step: Dict[str, Any]) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        chunk_delay = step.get("chunk_delay", 0)
+
+        async def send(data: str) -> None:
+            event = f"data: {data}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+
+        async def send_chunk(delta: Dict[str, Any], finish_reason: str | None = None, usage: Any = None) -> None:
+            await send(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                "usage": usage,
+            }))
+
+        await send_chunk({"role": "assistant", "content": ""})
+
+        for piece in _words(step.get("content", "")) if step.get("content") else []:
+            await asyncio.sleep(chunk_delay)
+            await send_chunk({"content": piece})
+
+        for index, call in enumerate(self._tool_calls(step)):
+            await asyncio.sleep(chunk_delay)
+            await send_chunk({"tool_calls": [{
+                "index": index,
+                "id": call["id"],
+                "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""},
+            }]})
+            arguments = call["function"]["arguments"]
+            for start in range(0, len(arguments), 8):
+                await asyncio.sleep(chunk_delay)
+                await send_chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 8]}}]})
+
+        await send_chunk({}, "tool_calls" if step.get("tool_calls") else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send_chunk({}, usage=self._usage(body, step))
+        await send("[DONE]")
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+async def _main(args: argparse.Namespace) -> None:
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    server = MockOpenAIServer(script, host=args.host, port=args.port)
+    await server.start()
+    print(f"Mock OpenAI server on {server.base_url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--script", help="JSON script of completions, see module docstring")
+    asyncio.run(_main(parser.parse_args()))
@@ -1,6 +1,6 @@
 """Base tool definition for the agent framework"""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Dict, List
 
 @dataclass
@@ -10,20 +10,38 @@ class Tool:
     name: str
     description: str
     input_schema: Dict[str, Any]
+    # Idempotent tools can opt in to the result cache of execute_tools
+    cacheable: bool = False
+    cache_ttl: float = 300.0
+    # How the scheduler runs the tool: "async" (execute), "thread" or "process" (execute_sync)
+    executor: str = "async"
+    # Concurrent calls allowed for this tool, None for only the global limit
+    max_concurrency: int | None = None
+    # Seconds before the call is abandoned, None for the scheduler default
+    timeout: float | None = None
+    # Serialized schema, built once so every request sends the same tool definitions
+    _api_dict: Dict[str, Any] | None = field(default=None, init=False, repr=False, compare=False)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert tool to dictionary format for OpenAI API"""
-        function = {
-            "name": self.name,
-            "description": self.description,
-            "parameters": self.input_schema,
-        }
+        if self._api_dict is None:
+            function = {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.input_schema,
+            }
+            
+            self._api_dict = {
+                "type": "function",
+                "function": function,
+            }
         
-        return {
-            "type": "function",
-            "function": function,
-        }
+        return self._api_dict
     
     async def execute(self, **kwargs: Any) -> Any:
         """Execute the tool with the given arguments"""
-        raise NotImplementedError("Subclasses must implement execute method")
\ No newline at end of file
+        raise NotImplementedError("Subclasses must implement execute method")
+
+    def execute_sync(self, **kwargs: Any) -> Any:
+        """Blocking or CPU-bound implementation, run in a worker pool for thread / process executors"""
+        raise NotImplementedError("Subclasses using a thread or process executor must implement execute_sync method")
\ No newline at end of file
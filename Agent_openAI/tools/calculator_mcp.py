@@ -1,6 +1,8 @@
 """Simple calculator tool that uses the MCP server"""
 
+import json
 import math
+from typing import Any, Dict, List
 
 from mcp.server import FastMCP
 
@@ -47,5 +49,144 @@ def calculator(number1:float, number2:float, operation:str) -> str:
     except Exception as e:
         return f"Error: {str(e)}"
     
+def _resolve(operand: Any, results: Dict[str, Any]) -> Any:
+    """Replace a "$id" reference with the result of that operation"""
+    if isinstance(operand, str) and operand.startswith("$"):
+        return results[operand[1:]]
+    return operand
+
+# Operations taking number1 and number2, sqrt only takes number1
+BINARY_OPERATIONS = {"+", "-", "*", "/", "^"}
+
+def _evaluate(number1: Any, number2: Any, operation: str) -> Any:
+    """Evaluate one operation, vectorized with NumPy when an operand is a list
+
+    Missing operands and non-finite results (overflow, NaN) are errors, so the
+    batch result stays valid JSON
+    """
+    if operation not in BINARY_OPERATIONS and operation != "sqrt":
+        raise ValueError("Invalid operation")
+    if number1 is None:
+        raise ValueError(f"Operation {operation} needs number1")
+    if operation in BINARY_OPERATIONS and number2 is None:
+        raise ValueError(f"Operation {operation} needs number2")
+
+    if isinstance(number1, (int, float)) and isinstance(number2, (int, float, type(None))):
+        result = calculator(number1, number2 if number2 is not None else 0, operation)
+        if result.startswith("Error"):
+            raise ValueError(result[len("Error: "):])
+        value = float(result[len("Result: "):])
+        if not math.isfinite(value):
+            raise ValueError("Result is not a finite number")
+        return int(value) if value.is_integer() else value
+
+    # Only imported when a batch actually has array operands
+    import numpy as np
+
+    a = np.asarray(number1, dtype=float)
+    b = np.asarray(number2 if number2 is not None else 0, dtype=float)
+
+    with np.errstate(all="ignore"):
+        if operation == "+":
+            result = a + b
+        elif operation == "-":
+            result = a - b
+        elif operation == "*":
+            result = a * b
+        elif operation == "/":
+            if np.any(b == 0):
+                raise ValueError("Division by zero")
+            result = a / b
+        elif operation == "^":
+            result = np.power(a, b)
+        else:
+            if np.any(a < 0):
+                raise ValueError("Negative number under square root")
+            result = np.sqrt(a)
+
+    if not np.all(np.isfinite(result)):
+        raise ValueError("Result is not a finite number")
+    return result.tolist()
+
+def _order(operations: List[Dict[str, Any]], errors: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Topological order of the operations, dependencies first
+
+    Operations in a cycle or referencing an unknown id are reported in errors
+    """
+    by_id = {str(op.get("id", i)): op for i, op in enumerate(operations)}
+    state: Dict[str, str] = {}
+    ordered = []
+
+    def visit(op_id: str) -> None:
+        if state.get(op_id) == "done":
+            return
+        if state.get(op_id) == "visiting":
+            raise ValueError(f"Cycle at {op_id}")
+        state[op_id] = "visiting"
+        for operand in (by_id[op_id].get("number1"), by_id[op_id].get("number2")):
+            if isinstance(operand, str) and operand.startswith("$"):
+                if operand[1:] not in by_id:
+                    raise ValueError(f"Unknown reference {operand}")
+                visit(operand[1:])
+        state[op_id] = "done"
+        ordered.append(op_id)
+
+    for op_id in by_id:
+        try:
+            visit(op_id)
+        except ValueError as e:
+            errors.setdefault(op_id, str(e))
+            state[op_id] = "done"
+
+    return [dict(by_id[op_id], id=op_id) for op_id in ordered if op_id not in errors]
+
+@mcp.tool(name="calculator_batch")
+def calculator_batch(operations: List[Dict[str, Any]]) -> str:
+    """Perform many calculator operations in one call
+
+    Args:
+        operations (list): Operations to perform, each as
+            {"id": "a", "number1": 3, "number2": 4, "operation": "*"}
+            - operation: one of (+ ,- , *, /, ^, sqrt)
+            - number1 / number2: a number, a list of numbers (applied element-wise),
+              or "$<id>" to use the result of another operation in the batch
+            Operations are evaluated in dependency order, not list order.
+
+    Returns:
+        str: JSON list with {"id": ..., "result": ...} or {"id": ..., "error": ...} per operation
+    """
+
+    errors: Dict[str, str] = {}
+    results: Dict[str, Any] = {}
+
+    for op in _order(operations, errors):
+        op_id = op["id"]
+        failed = [
+            operand[1:] for operand in (op.get("number1"), op.get("number2"))
+            if isinstance(operand, str) and operand.startswith("$") and operand[1:] in errors
+        ]
+        if failed:
+            errors[op_id] = f"Depends on failed operation {failed[0]}"
+            continue
+
+        try:
+            results[op_id] = _evaluate(
+                _resolve(op.get("number1"), results),
+                _resolve(op.get("number2"), results),
+                op.get("operation", ""),
+            )
+        except Exception as e:
+            errors[op_id] = str(e)
+
+    report = []
+    for i, op in enumerate(operations):
+        op_id = str(op.get("id", i))
+        if op_id in errors:
+            report.append({"id": op_id, "error": errors[op_id]})
+        else:
+            report.append({"id": op_id, "result": results[op_id]})
+
+    return json.dumps(report)
+
 if __name__ == "__main__":
     mcp.run()
\ No newline at end of file
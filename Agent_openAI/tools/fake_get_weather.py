@@ -18,7 +18,9 @@ class FakeGetWeather(Tool):
                     }
                 },
                 "required": ["city"],
-            }
+            },
+            cacheable=True,
+            cache_ttl=600.0,
         )
         
     async def execute(self, city: str) -> str:
@@ -4,23 +4,40 @@ from typing import Any, Dict, List
 from tools.base import Tool
 
 class MCPTool(Tool):
-    def __init__(self, name:str, description:str, input_schema:Dict[str, Any], connection: "MCPConnection"):
-        super().__init__(name, description, input_schema)
+    def __init__(
+        self,
+        name:str,
+        description:str,
+        input_schema:Dict[str, Any],
+        connection: "MCPConnection",
+        cacheable: bool = False,
+        cache_ttl: float = 300.0,
+    ):
+        super().__init__(name, description, input_schema, cacheable, cache_ttl)
         self.connection = connection
 
     async def execute(self, **kwargs: Any) -> Any:
-        """Execute the tool with the given arguments"""
-        try:
-            result = await self.connection.call_tool(self.name, arguments=kwargs)
-            
-            if hasattr(result, "content") and result.content:
-                for item in result.content:
-                    if getattr(item, "type", None) == "text":
-                        return item.text
-            
+        """Execute the tool with the given arguments
+
+        Failures are raised, not returned, so the result cache never keeps them;
+        execute_tools reports them to the model as the tool result
+        """
+        # Only cacheable tools are known to be idempotent and safe to send twice
+        result = await self.connection.call_tool(self.name, arguments=kwargs, idempotent=self.cacheable)
+
+        text = None
+        if hasattr(result, "content") and result.content:
+            for item in result.content:
+                if getattr(item, "type", None) == "text":
+                    text = item.text
+                    break
+
+        if getattr(result, "isError", False):
+            raise RuntimeError(text or "the MCP server reported an error")
+
+        if text is None:
             return "No text content found in the tool response"
-        except Exception as e:
-            return f"Error executing tool{self.name}: {str(e)}"
+        return text
 
     async def list_tools(self, **kwargs: Any) -> List[str]:
         """List all tools available on the MCP server
@@ -0,0 +1,157 @@
+"""Result cache for idempotent tool calls"""
+
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from loguru import logger
+
+class _LeaderCancelled(Exception):
+    """Set on a shared execution whose caller was cancelled, its waiters run the call again"""
+
+class ToolResultCache:
+    """LRU cache of tool results with per-entry TTL
+
+    Entries live in memory and, if db_path is given, in an SQLite file so they
+    survive restarts and can be shared by several worker processes.
+    Identical calls that are in flight at the same time share one execution.
+    """
+
+    def __init__(self, max_size: int = 1024, db_path: str | None = None):
+        self.max_size = max_size
+        self.db_path = db_path
+        # key -> (result, expires_at)
+        self._entries: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self._db: sqlite3.Connection | None = None
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(name: str, arguments: Dict[str, Any]) -> str:
+        """Tool name plus canonicalized arguments, so key order and spacing don't matter"""
+        return name + ":" + json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, result) for a key"""
+        now = time.time()
+
+        if key in self._entries:
+            result, expires_at = self._entries[key]
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return True, result
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                result = json.loads(row[0])
+                self._store(key, result, row[1])
+                return True, result
+
+        return False, None
+
+    def set(self, key: str, result: Any, ttl: float) -> None:
+        """Store a result for ttl seconds"""
+        expires_at = time.time() + ttl
+        self._store(key, result, expires_at)
+
+        if self._db is not None:
+            try:
+                value = json.dumps(result)
+            except TypeError:
+                # Only JSON results go to disk, the memory entry is still used
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._db.commit()
+
+    def _store(self, key: str, result: Any, expires_at: float) -> None:
+        self._entries[key] = (result, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_execute(
+        self,
+        key: str,
+        ttl: float,
+        execute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the cached result or execute once, coalescing identical in-flight calls
+
+        Exceptions are not cached, every waiter of the failed execution gets the exception.
+        If the caller running the shared execution is cancelled, its waiters are not:
+        one of them runs the call again
+        """
+        while True:
+            hit, result = self.get(key)
+            if hit:
+                self.hits += 1
+                return result
+
+            if (future := self._in_flight.get(key)) is None:
+                break
+            try:
+                result = await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+
+        try:
+            result = await execute()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited failure doesn't warn at garbage collection
+            future.exception()
+            raise
+        else:
+            self.set(key, result, ttl)
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def clear(self) -> None:
+        """Drop every entry from memory and disk"""
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM tool_cache")
+            self._db.commit()
+
+_tool_cache = ToolResultCache()
+
+def get_tool_cache() -> ToolResultCache:
+    """Process-wide cache used by execute_tools"""
+    return _tool_cache
+
+def configure_tool_cache(max_size: int = 1024, db_path: str | None = None) -> ToolResultCache:
+    """Replace the process-wide cache, e.g. to back it with an SQLite file"""
+    global _tool_cache
+    _tool_cache = ToolResultCache(max_size=max_size, db_path=db_path)
+    logger.info(f"Tool cache configured: max_size={max_size}, db_path={db_path}")
+    return _tool_cache
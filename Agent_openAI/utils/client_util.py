@@ -0,0 +1,93 @@
+"""Shared async OpenAI client with a pooled HTTP connection"""
+
+import asyncio
+import os
+import weakref
+from dataclasses import dataclass
+
+import httpx
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+api_key = os.getenv("OPENAI_API_KEY")
+api_version = os.getenv("OPENAI_API_VERSION")
+api_base = os.getenv("OPENAI_API_BASE")
+
+@dataclass
+class PoolConfig:
+    """HTTP connection pool configuration shared by every agent in the process"""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+
+# httpx pools are bound to the event loop that opened them,
+# so we keep one client per running loop instead of one per agent
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_pool_config = PoolConfig()
+
+def configure_pool(config: PoolConfig) -> None:
+    """Set the pool configuration used for clients created from now on"""
+    global _pool_config
+    _pool_config = config
+
+def _create_http_client(config: PoolConfig) -> httpx.AsyncClient:
+    """Create the httpx client with bounded pool and keep-alive"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+    )
+
+def create_client(
+    config: PoolConfig | None = None,
+    base_url: str | None = None,
+    key: str | None = None,
+) -> AsyncOpenAI:
+    """Create a new async client, Azure if an API version is configured
+
+    base_url / key override the environment, e.g. to point at a local mock server
+    """
+    http_client = _create_http_client(config or _pool_config)
+
+    if base_url:
+        return AsyncOpenAI(api_key=key or api_key, base_url=base_url, http_client=http_client)
+
+    if api_version:
+        return AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=api_version,
+            azure_endpoint=api_base,
+            http_client=http_client,
+        )
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=api_base,
+        http_client=http_client,
+    )
+
+def get_shared_client() -> AsyncOpenAI:
+    """Return the client shared by every agent running on the current event loop"""
+    loop = asyncio.get_running_loop()
+
+    if (client := _clients.get(loop)) is None:
+        client = create_client()
+        _clients[loop] = client
+
+    return client
+
+async def close_shared_client() -> None:
+    """Close the shared client of the current event loop, if any"""
+    loop = asyncio.get_running_loop()
+
+    if (client := _clients.pop(loop, None)) is not None:
+        await client.close()
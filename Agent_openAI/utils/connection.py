@@ -1,13 +1,14 @@
 """Connection handling for MCP server"""
 
+import asyncio
+import json
+import weakref
 from abc import ABC, abstractmethod
-from contextlib import AsyncExitStack
 from typing import Any, Dict, List
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from mcp.client.sse import sse_client
-import sys
 
 from tools.mcp_tool import MCPTool
 
@@ -34,7 +35,7 @@ class MCPConnection(ABC):
         self._rw_ctx = await self._create_rw_context()
         read, write = await self._rw_ctx.__aenter__()
         self._session_ctx = ClientSession(read, write)
-        self.session = self._session_ctx.__aenter__()
+        self.session = await self._session_ctx.__aenter__()
         await self.session.initialize()
         return self
 
@@ -52,8 +53,8 @@ class MCPConnection(ABC):
         """List all tools available on the MCP server"""
         return await self.session.list_tools()
     
-    async def call_tool(self, name:str, arguments:Dict[str, Any]) -> Any:
-        """Call a tool on the MCP server"""
+    async def call_tool(self, name:str, arguments:Dict[str, Any], idempotent: bool = False) -> Any:
+        """Call a tool on the MCP server, a single connection never retries"""
         return await self.session.call_tool(name, arguments=arguments)
     
 class MCPConnectionStdio(MCPConnection):
@@ -109,34 +110,270 @@ def create_mcp_connection(config: Dict[str, Any]) -> MCPConnection:
         
     raise ValueError(f"Invalid connection type: {config.get('type')}")
 
-async def setup_mcp_connections(
-    mcp_servers: List[Dict[str, Any]] | None,
-    stack: AsyncExitStack,
-) -> List[MCPTool]:
-    if not mcp_servers:
-        return []
+class _HeldConnection:
+    """Keep one MCP connection open in its own task
     
-    mcp_tools = []
-    
-    for config in mcp_servers:
+    The stdio / SSE clients use anyio cancel scopes which must be exited by the task
+    that entered them, so the context is held by a background task instead of the
+    agent run that happened to open it
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.connection: MCPConnection | None = None
+        self.in_flight = 0
+        self._task: asyncio.Task | None = None
+        self._ready: asyncio.Future | None = None
+        self._stop: asyncio.Event | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.connection is not None and self._task is not None and not self._task.done()
+
+    async def open(self) -> None:
+        """Start the connection and wait until the MCP session is initialized"""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._hold())
+        await self._ready
+
+    async def _hold(self) -> None:
         try:
-            connection = create_mcp_connection(config)
-            # Enter the context of the MCP connection
-            await stack.enter_async_context(connection)
-            
-            # Retrieve the list of tools from the MCP server (According to MCP format)
-            tools = await connection.list_tools()
-            for tool in tools:
-                mcp_tools.append(MCPTool(
-                    name = tool.name,
-                    description = tool.description or f"MCP tool {tool.name}",
-                    input_schema = tool.input_schema,
-                    connection = connection
-                ))
+            async with create_mcp_connection(self.config) as connection:
+                self.connection = connection
+                self._ready.set_result(None)
+                await self._stop.wait()
         except Exception as e:
-            print(f"Error setting up MCP connection: {e}")
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                print(f"MCP connection lost: {e}")
+        finally:
+            self.connection = None
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await self._task
+        except BaseException as e:
+            print(f"Error closing MCP connection: {e}")
+        self._task = None
+
+    async def reconnect(self) -> None:
+        await self.close()
+        await self.open()
+
+class MCPServerPool:
+    """Bounded pool of live connections to one MCP server
+    
+    MCP sessions multiplex requests by id, so each connection serves up to
+    max_calls_per_connection concurrent call_tool requests; the pool as a whole
+    never has more than pool_size * max_calls_per_connection in flight
+    """
+    def __init__(self, config: Dict[str, Any], pool_size: int = 2, max_calls_per_connection: int = 8):
+        self.config = config
+        self.pool_size = pool_size
+        self.tools: List[Any] = []
+        self._connections = [_HeldConnection(config) for _ in range(pool_size)]
+        self._slots = asyncio.Semaphore(pool_size * max_calls_per_connection)
+        self._reconnect_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Open every connection of the pool concurrently and fetch the tool list once"""
+        results = await asyncio.gather(
+            *[connection.open() for connection in self._connections],
+            return_exceptions=True,
+        )
+        if all(isinstance(result, BaseException) for result in results):
+            raise results[0]
+
+        self.tools = (await self._pick().connection.list_tools()).tools
+
+    def _pick(self) -> _HeldConnection:
+        """Least loaded live connection"""
+        alive = [connection for connection in self._connections if connection.alive]
+        if not alive:
+            raise ConnectionError(f"No live connection to MCP server {self.config}")
+        return min(alive, key=lambda connection: connection.in_flight)
+
+    async def list_tools(self) -> Any:
+        return await self._pick().connection.list_tools()
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], idempotent: bool = False) -> Any:
+        """Call a tool on the least loaded connection
+
+        A dead connection is reconnected before the request is sent. If it dies
+        once the request is sent, the tool may have run already, so the call is
+        only retried for idempotent tools and otherwise fails
+        """
+        async with self._slots:
+            try:
+                held = self._pick()
+            except ConnectionError:
+                await self.health_check()
+                held = self._pick()
+
+            held.in_flight += 1
+            try:
+                if (connection := held.connection) is None:
+                    # Died since it was picked, nothing was sent yet
+                    await self._reconnect(held)
+                    connection = held.connection
+                try:
+                    return await connection.call_tool(name, arguments=arguments)
+                except Exception:
+                    if held.alive or not idempotent:
+                        raise
+                    # The server went away mid-call, retry once on a fresh connection
+                    await self._reconnect(held)
+                    return await held.connection.call_tool(name, arguments=arguments)
+            finally:
+                held.in_flight -= 1
+
+    async def _reconnect(self, held: _HeldConnection) -> None:
+        async with self._reconnect_lock:
+            if not held.alive:
+                await held.reconnect()
+
+    async def health_check(self) -> None:
+        """Ping idle connections and reconnect the ones that are dead"""
+        async def check(held: _HeldConnection) -> None:
+            try:
+                if held.alive and held.in_flight == 0:
+                    await asyncio.wait_for(held.connection.session.send_ping(), timeout=5)
+            except Exception as e:
+                print(f"MCP health check failed: {e}")
+                await held.close()
+
+            if not held.alive:
+                try:
+                    await self._reconnect(held)
+                except Exception as e:
+                    print(f"Error reconnecting MCP server: {e}")
+
+        await asyncio.gather(*[check(held) for held in self._connections])
+
+    async def close(self) -> None:
+        await asyncio.gather(*[connection.close() for connection in self._connections])
+
+class MCPConnectionManager:
+    """Process-wide MCP connections shared by every agent run
+    
+    Servers are started concurrently on first use and kept alive across runs,
+    with a background task that health-checks and reconnects them
+    """
+    def __init__(self, pool_size: int = 2, max_calls_per_connection: int = 8, health_check_interval: float = 30.0):
+        self.pool_size = pool_size
+        self.max_calls_per_connection = max_calls_per_connection
+        self.health_check_interval = health_check_interval
+        self._pools: Dict[str, asyncio.Task] = {}
+        self._tools: Dict[str, List[MCPTool]] = {}
+        self._health_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(config: Dict[str, Any]) -> str:
+        return json.dumps(config, sort_keys=True)
+
+    async def _start_pool(self, config: Dict[str, Any]) -> MCPServerPool:
+        pool = MCPServerPool(
+            config,
+            pool_size=config.get("pool_size", self.pool_size),
+            max_calls_per_connection=self.max_calls_per_connection,
+        )
+        await pool.start()
+        return pool
+
+    async def get_pool(self, config: Dict[str, Any]) -> MCPServerPool:
+        """Return the pool for a server config, starting it once even if many runs ask at the same time"""
+        key = self._key(config)
+
+        if key not in self._pools:
+            self._pools[key] = asyncio.create_task(self._start_pool(config))
+
+        try:
+            return await asyncio.shield(self._pools[key])
+        except Exception:
+            # Let a later run try again instead of caching the failure
+            self._pools.pop(key, None)
+            raise
+
+    async def get_tools(self, mcp_servers: List[Dict[str, Any]] | None) -> List[MCPTool]:
+        """MCP tools of every configured server, starting missing servers concurrently"""
+        if not mcp_servers:
+            return []
+
+        self._ensure_health_task()
+
+        pools = await asyncio.gather(
+            *[self.get_pool(config) for config in mcp_servers],
+            return_exceptions=True,
+        )
+
+        mcp_tools = []
+        for config, pool in zip(mcp_servers, pools):
+            if isinstance(pool, BaseException):
+                print(f"Error setting up MCP connection: {pool}")
+                continue
+
+            key = self._key(config)
+            if key not in self._tools:
+                self._tools[key] = [
+                    MCPTool(
+                        name = tool.name,
+                        description = tool.description or f"MCP tool {tool.name}",
+                        input_schema = tool.inputSchema,
+                        connection = pool,
+                        # Servers whose tools are idempotent opt in with "cache_ttl" in their config
+                        cacheable = "cache_ttl" in config,
+                        cache_ttl = config.get("cache_ttl", 300.0),
+                    )
+                    for tool in pool.tools
+                ]
+            mcp_tools.extend(self._tools[key])
+
+        return mcp_tools
+
+    def _ensure_health_task(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            pools = [task.result() for task in list(self._pools.values()) if task.done() and not task.exception()]
+            await asyncio.gather(*[pool.health_check() for pool in pools], return_exceptions=True)
+
+    async def close(self) -> None:
+        """Stop health checks and close every server connection"""
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+
+        tasks = list(self._pools.values())
+        self._pools.clear()
+        self._tools.clear()
+
+        for pool in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(pool, MCPServerPool):
+                await pool.close()
+
+# Connections belong to the event loop that opened them, one manager per loop
+_managers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MCPConnectionManager]" = weakref.WeakKeyDictionary()
+
+def get_mcp_manager() -> MCPConnectionManager:
+    """Return the MCP connection manager of the current event loop"""
+    loop = asyncio.get_running_loop()
+
+    if (manager := _managers.get(loop)) is None:
+        manager = MCPConnectionManager()
+        _managers[loop] = manager
 
-    print(f"loaded {len(mcp_tools)} MCP tools from {len(mcp_servers)} servers")        
-    return mcp_tools
+    return manager
 
+async def close_mcp_manager() -> None:
+    """Close the MCP connection manager of the current event loop, if any"""
+    loop = asyncio.get_running_loop()
 
+    if (manager := _managers.pop(loop, None)) is not None:
+        await manager.close()
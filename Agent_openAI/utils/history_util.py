@@ -1,16 +1,41 @@
 """Message History with token tracking"""
 
-from typing import Any, List, Dict, Optional, Tuple
+import asyncio
+from collections import deque
+from typing import Any, Deque, List, Dict
 
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
 
 from loguru import logger
 
-import tiktoken
+from utils.client_util import get_shared_client
+from utils.telemetry import preview, record_truncation
+from utils.tokenizer_util import get_tokenizer_registry
+
+# Every message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for an assistant that will continue it. "
+    "Keep facts, decisions, user preferences, tool results and open questions. "
+    "Merge it with the existing summary if there is one. Be concise."
+)
 
 class MessageHistory:
-    """Manages chat history with token tracking and context management"""
-    
+    """Manages chat history with token tracking and context management
+
+    Messages are kept in API format in a deque, each with its token count computed
+    once when it is added, so the history size is always known before a request
+
+    With compaction enabled, turns beyond recent_budget_tokens are summarized into
+    a running summary message in the background between turns instead of being dropped
+    """
+
+    TRUNCATION_MESSAGE = {
+        "role": "user",
+        "content": "[Earlier history has been truncated.]"
+    }
+
     def __init__(
         self,
         model: str,
@@ -18,29 +43,80 @@ class MessageHistory:
         context_window_tokens: int,
         client: Any,
         #enable_caching: bool = True,
+        compaction: bool = False,
+        summary_budget_tokens: int = 512,
+        recent_budget_tokens: int | None = None,
+        truncation_headroom: float = 0.25,
     ):
-        # If we use azure openai, it would be deployment name, hence tiktoken should use get_encoding instead of encoding_for_model
+        # If we use azure openai, it would be deployment name, the tokenizer registry maps it to the default encoding
         self.model = model
         self.system = system
         self.context_window_tokens = context_window_tokens
         self.client = client
-        # OpenAI ChatCompletionMessage need to be in the History for Function Calling
-        self.messages: List[Dict[str, Any]|ChatCompletionMessage] = []
-        self.total_tokens = 0
+        self.messages: Deque[Dict[str, Any]] = deque()
+        # Local token count of each message, same order as messages
+        self.message_tokens: Deque[int] = deque()
         # self.enable_caching = enable_caching
-        # We follow (Input, Output) token count
-        self.message_tokens: List[Tuple[int, int]] = []
-        
-        try:
-            # encoding = tiktoken.encoding_for_model(model)
-            encoding = tiktoken.get_encoding("o200k_base")
-            system_token = len(encoding.encode(system))
-        except Exception as e:
-            logger.error(f"Error getting system token count for {self.model}: {e}")
-            system_token = len(self.system)/4
-        
-        self.total_tokens = system_token
-        
+        self.truncated = False
+        # Last usage reported by the API, to compare with the local count
+        self.last_usage: Any = None
+        # Prompt tokens served from the provider prompt cache
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        # Truncate below the budget by this fraction, so the prefix stays frozen for a while
+        self.truncation_headroom = truncation_headroom
+
+        self.compaction = compaction
+        self.summary_budget_tokens = summary_budget_tokens
+        # Tokens of recent turns kept verbatim, half the window by default
+        self.recent_budget_tokens = recent_budget_tokens or context_window_tokens // 2
+        self.summary: Dict[str, Any] | None = None
+        self.summary_tokens = 0
+        # Turns being summarized, still sent verbatim until the summary is ready
+        self.compacting: List[Dict[str, Any]] = []
+        self.compacting_tokens = 0
+        self._compaction_task: asyncio.Task | None = None
+
+        # Set by the session manager when the history is persisted
+        self.store: Any = None
+        self.session_id: str | None = None
+
+        self.system_tokens = self._count_text(system) + MESSAGE_OVERHEAD_TOKENS
+        self.truncation_tokens = self.count_tokens(self.TRUNCATION_MESSAGE)
+        self.total_tokens = self.system_tokens
+
+    def _count_text(self, text: str) -> int:
+        # The encoding is shared by every history, agents warm it off the event loop before a turn
+        return get_tokenizer_registry().count(text, self.model)
+
+    def count_tokens(self, message: Dict[str, Any]) -> int:
+        """Token count of one API message, including tool call names and arguments"""
+        tokens = MESSAGE_OVERHEAD_TOKENS + self._count_text(message.get("content") or "")
+
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            tokens += self._count_text(function["name"]) + self._count_text(function["arguments"])
+
+        return tokens
+
+    @staticmethod
+    def _to_api_message(role: str, content: Any) -> Dict[str, Any]:
+        """Normalize what the agent passes in to an API message dict, once"""
+        if isinstance(content, ChatCompletionMessage):
+            message = {"role": "assistant", "content": content.content}
+            if content.tool_calls:
+                message["tool_calls"] = [tool_call.model_dump() for tool_call in content.tool_calls]
+            return message
+
+        if isinstance(content, dict) and "role" in content:
+            # Already a complete API message, e.g. tool results or streamed tool calls
+            message = dict(content)
+            if message.get("content") is not None and not isinstance(message["content"], str):
+                message["content"] = str(message["content"])
+            return message
+
+        return {"role": role, "content": content}
+
     async def add_message(
         self,
         role: str,
@@ -48,99 +124,192 @@ class MessageHistory:
         usage: Any | None = None,
     ) -> None:
         """Add a message to the history and track token usage
-        
-        Only Update message_tokens, total_tokens when role is assistant
-        Usage is important for counting the token counting
+
+        Tokens are counted locally when the message is added,
+        usage from the API is only kept for reference
+        """
+
+        # Lazy, so large payloads are only stringified when the level is enabled
+        logger.opt(lazy=True).debug("{}: add {} to history", lambda: role, lambda: preview(content))
+
+        message = self._to_api_message(role, content)
+        tokens = self.count_tokens(message)
+
+        self.messages.append(message)
+        self.message_tokens.append(tokens)
+        self.total_tokens += tokens
+
+        if self.store is not None:
+            self.store.append(self.session_id, message, tokens)
+
+        if usage:
+            self.last_usage = usage
+            self.prompt_tokens += usage.prompt_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of prompt tokens that were served from the provider prompt cache"""
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+    def attach_store(self, store: Any, session_id: str) -> None:
+        """Persist every message added from now on to a session store"""
+        self.store = store
+        self.session_id = session_id
+
+    def restore(self, messages: List[tuple]) -> None:
+        """Load (message, tokens) pairs from a session store, without writing them back"""
+        for message, tokens in messages:
+            self.messages.append(message)
+            self.message_tokens.append(tokens)
+            self.total_tokens += tokens
+
+    def _pop_turn(self) -> None:
+        """Remove the oldest turn: a user message and everything up to the next user message
+
+        Keeps assistant tool_calls and their tool results together, which the API requires
+        """
+        self.total_tokens -= self.message_tokens.popleft()
+        self.messages.popleft()
+
+        while self.messages and self.messages[0]["role"] != "user":
+            self.total_tokens -= self.message_tokens.popleft()
+            self.messages.popleft()
+
+    def _turn_count(self) -> int:
+        return sum(1 for message in self.messages if message["role"] == "user")
+
+    def truncate(self, reserve_tokens: int = 0) -> None:
+        """Remove oldest turns until the prompt fits the context window
+
+        reserve_tokens leaves room for the completion, e.g. max_tokens.
+        Turns are removed down to truncation_headroom below the budget, so the
+        start of the prompt (and the provider prompt cache) holds for several
+        calls instead of shifting on every one. The latest turn is never removed
+        """
+        budget = self.context_window_tokens - reserve_tokens
+        if self.total_tokens <= budget:
+            return
+
+        target = int(budget * (1 - self.truncation_headroom))
+
+        logger.info("Truncating history to {} tokens", budget)
+        record_truncation()
+
+        if self.compacting:
+            # Hard limit reached while a summary is pending, fall back to dropping
+            self.total_tokens -= self.compacting_tokens
+            self.compacting, self.compacting_tokens = [], 0
+
+        if not self.truncated and self.summary is None:
+            self.truncated = True
+            self.total_tokens += self.truncation_tokens
+
+        turns = self._turn_count()
+        while self.total_tokens > target and turns > 1:
+            self._pop_turn()
+            turns -= 1
+
+    def schedule_compaction(self) -> None:
+        """Summarize old turns in the background, call between turns
+
+        Turns older than recent_budget_tokens are moved aside and summarized together
+        with the previous summary, then replaced by it. Nothing happens on the request path
         """
-        
-        logger.info(f"{role}: add {content} to history")
-        
-        if content == ChatCompletionMessage:
-            self.messages.append(content)
-        else:
-            self.messages.append({
-                "role": role,
-                "content": content,
-            })
-        
-        if role == "assistant":
-            total_input = usage.prompt_tokens
-            output_tokens = usage.completion_tokens
-        
-            current_turn_input = total_input - self.total_tokens
-            
-            self.message_tokens.append((current_turn_input, output_tokens))
-            self.total_tokens += current_turn_input + output_tokens
-            
-    def truncate(self) -> None:
-        """Remove oldest messages when context window is exceeded"""
-        if self.total_tokens <= self.context_window_tokens:
+        if not self.compaction or self._compaction_task is not None:
+            return
+
+        turns = self._turn_count()
+        evicted: List[Dict[str, Any]] = []
+        evicted_tokens = 0
+
+        while self.total_tokens - self.system_tokens - self.summary_tokens - self.compacting_tokens - evicted_tokens > self.recent_budget_tokens and turns > 1:
+            evicted_tokens += self.message_tokens.popleft()
+            evicted.append(self.messages.popleft())
+            while self.messages and self.messages[0]["role"] != "user":
+                evicted_tokens += self.message_tokens.popleft()
+                evicted.append(self.messages.popleft())
+            turns -= 1
+
+        if not evicted:
             return
-        
-        TRUNCATION_NOTICE_TOKENS = 7
-        TRUNCATION_MESSAGE = {
-            "role": "user",
-            "content": "[Earlier history has been truncated.]"
-        }
-        
-        def remove_messages():
-            """Remove messages from the history
-            
-            To handle User, Assistant pair or combination of User Assistant pair followed by Function Call
-            """
-            add_user_input = False
-            
-            self.messages.pop(0)
-            self.messages.pop(0)
-            
-            if self.messages[0]["role"] == "tool":
-                while self.messages[0]["role"] == "tool":
-                    self.messages.pop(0)
-                add_user_input = True
-                
-            if add_user_input:
-                self.messages.insert(0, {"role": "user", "content": ""})
-                
-            if self.message_tokens:
-                input_tokens, output_tokens = self.message_tokens.pop(0)
-                self.total_tokens -= input_tokens + output_tokens
-        
-        while(
-            self.message_tokens
-            and self.total_tokens > self.context_window_tokens
-            and len(self.messages) > 2
-        ):
-            logger.info(f"Truncating history to {self.context_window_tokens} tokens")
-            remove_messages()
-        
-        if self.messages and self.message_tokens:
-            # To show truncation notice
-            self.messages[0] = TRUNCATION_MESSAGE
-
-            original_input_tokens, original_output_tokens = self.message_tokens[0]
-            self.message_tokens[0] = (
-                TRUNCATION_NOTICE_TOKENS,
-                original_output_tokens
+
+        self.compacting = evicted
+        self.compacting_tokens = evicted_tokens
+        self._compaction_task = asyncio.create_task(self._compact())
+
+    async def _compact(self) -> None:
+        """Replace the compacting turns with an updated running summary"""
+        compacting = self.compacting
+        try:
+            transcript = "\n".join(
+                f"{message['role']}: {message.get('content') or message.get('tool_calls')}"
+                for message in compacting
             )
-            
-            self.total_tokens += (
-                TRUNCATION_NOTICE_TOKENS - original_input_tokens
+            if self.summary is not None:
+                transcript = f"Existing summary:\n{self.summary['content']}\n\nConversation:\n{transcript}"
+
+            client = self.client or get_shared_client()
+            response = await client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript},
+                ],
+                max_tokens=self.summary_budget_tokens,
+                temperature=0,
             )
 
-    def format_for_api(self) -> List[Dict[str, Any]|ChatCompletionMessage]:
-        """Format the history for OpenAI API"""
-        result = []
-        
-        for message in self.messages:
-            if isinstance(message, ChatCompletionMessage):
-                result.append(message)
-            else:
-                result.append({
-                    "role": message["role"],
-                    "content": message["content"]
-                })
-                
+            if self.compacting is not compacting:
+                # A hard truncation dropped these turns meanwhile
+                return
+
+            summary = {
+                "role": "user",
+                "content": f"[Summary of earlier conversation]\n{response.choices[0].message.content}",
+            }
+            summary_tokens = self.count_tokens(summary)
+
+            self.total_tokens += summary_tokens - self.summary_tokens - self.compacting_tokens
+            self.summary, self.summary_tokens = summary, summary_tokens
+            self.compacting, self.compacting_tokens = [], 0
+            logger.info(f"Compacted {len(compacting)} messages into a {summary_tokens} token summary")
+        except Exception as e:
+            # Keep the turns verbatim, truncation still bounds the prompt
+            logger.error(f"Error compacting history: {e}")
+            if self.compacting is compacting:
+                self.messages.extendleft(reversed(compacting))
+                self.message_tokens.extendleft(reversed([self.count_tokens(message) for message in compacting]))
+                self.compacting, self.compacting_tokens = [], 0
+        finally:
+            self._compaction_task = None
+
+    @property
+    def compaction_running(self) -> bool:
+        """A background compaction is summarizing turns of this history"""
+        return self._compaction_task is not None
+
+    async def wait_for_compaction(self) -> None:
+        """Wait for a pending background compaction, e.g. before shutdown"""
+        if self._compaction_task is not None:
+            await self._compaction_task
+
+    def format_for_api(self) -> List[Dict[str, Any]]:
+        """Format the history for OpenAI API
+
+        Messages are stored in API format already, so this is only a shallow copy
+        """
+        if self.summary is not None or self.compacting:
+            prefix = [self.summary] if self.summary is not None else []
+            return [*prefix, *self.compacting, *self.messages]
+
+        if self.truncated:
+            return [self.TRUNCATION_MESSAGE, *self.messages]
+
         # if self.enable_caching and self.messages:
         # """Perform certain caching operations"""
-        
-        return result
\ No newline at end of file
+
+        return list(self.messages)
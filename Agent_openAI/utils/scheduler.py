@@ -0,0 +1,149 @@
+"""Tool execution scheduler with concurrency limits, deadlines and worker pools"""
+
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict
+
+from loguru import logger
+
+from tools.base import Tool
+
+class ToolTimeoutError(Exception):
+    """Tool call did not finish before its deadline"""
+
+class ToolCancelledError(Exception):
+    """Tool call was cancelled through the scheduler"""
+
+# Worker pools are shared by every event loop of the process
+_thread_pool: ThreadPoolExecutor | None = None
+_process_pool: ProcessPoolExecutor | None = None
+
+def _get_executor(kind: str) -> Executor:
+    global _thread_pool, _process_pool
+
+    if kind == "thread":
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=min(32, (os.cpu_count() or 1) + 4),
+                thread_name_prefix="tool",
+            )
+        return _thread_pool
+
+    if kind == "process":
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _process_pool
+
+    raise ValueError(f"Invalid executor type: {kind}")
+
+def shutdown_executors() -> None:
+    """Shut down the shared thread and process pools"""
+    global _thread_pool, _process_pool
+
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+class ToolScheduler:
+    """Run tool calls under a global and a per-tool concurrency limit
+
+    Tools declare how they run with `executor`:
+    - "async": `await tool.execute(...)` on the event loop
+    - "thread": `tool.execute_sync(...)` in the shared thread pool, for blocking I/O
+    - "process": `tool.execute_sync(...)` in the shared process pool, for CPU-bound work
+    The deadline covers waiting for a slot as well as the execution itself.
+    """
+
+    def __init__(self, max_concurrency: int = 64, default_timeout: float = 60.0):
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_tool: Dict[str, asyncio.Semaphore] = {}
+        # Keyed by task, call ids come from the model and may repeat across turns or sessions
+        self._running: Dict[asyncio.Task, str | None] = {}
+
+    def _tool_semaphore(self, tool: Tool) -> asyncio.Semaphore | None:
+        if not tool.max_concurrency:
+            return None
+        if tool.name not in self._per_tool:
+            self._per_tool[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+        return self._per_tool[tool.name]
+
+    async def _dispatch(self, tool: Tool, arguments: Dict[str, Any]) -> Any:
+        if tool.executor == "async":
+            return await tool.execute(**arguments)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_executor(tool.executor),
+            functools.partial(tool.execute_sync, **arguments),
+        )
+
+    async def _run_limited(self, tool: Tool, arguments: Dict[str, Any]) -> Any:
+        timeout = tool.timeout or self.default_timeout
+        try:
+            async with asyncio.timeout(timeout):
+                async with self._global:
+                    semaphore = self._tool_semaphore(tool)
+                    if semaphore is None:
+                        return await self._dispatch(tool, arguments)
+                    async with semaphore:
+                        return await self._dispatch(tool, arguments)
+        except TimeoutError:
+            # Threads can't be interrupted, the worker finishes in the background but the result is dropped
+            raise ToolTimeoutError(f"Tool {tool.name} timed out after {timeout}s") from None
+
+    async def run(self, tool: Tool, arguments: Dict[str, Any], call_id: str | None = None) -> Any:
+        """Run one tool call, cancellable by call_id through cancel()"""
+        task = asyncio.create_task(self._run_limited(tool, arguments))
+        self._running[task] = call_id
+
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                # The caller itself is being cancelled, propagate
+                task.cancel()
+                raise
+            raise ToolCancelledError(f"Tool {tool.name} was cancelled") from None
+        finally:
+            self._running.pop(task, None)
+
+    def cancel(self, call_id: str) -> bool:
+        """Cancel the running tool calls with this call_id, False if there is none"""
+        cancelled = False
+        for task, running_id in list(self._running.items()):
+            if running_id == call_id:
+                cancelled = task.cancel() or cancelled
+        return cancelled
+
+    def cancel_all(self) -> None:
+        """Cancel every running tool call, e.g. when a conversation is aborted"""
+        logger.info(f"Cancelling {len(self._running)} running tool calls")
+        for task in list(self._running):
+            task.cancel()
+
+# Semaphores belong to the event loop that uses them, one scheduler per loop
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ToolScheduler]" = weakref.WeakKeyDictionary()
+_scheduler_options: Dict[str, Any] = {}
+
+def configure_tool_scheduler(max_concurrency: int = 64, default_timeout: float = 60.0) -> None:
+    """Set the limits used by schedulers created from now on"""
+    _scheduler_options.update(max_concurrency=max_concurrency, default_timeout=default_timeout)
+
+def get_tool_scheduler() -> ToolScheduler:
+    """Return the tool scheduler of the current event loop"""
+    loop = asyncio.get_running_loop()
+
+    if (scheduler := _schedulers.get(loop)) is None:
+        scheduler = ToolScheduler(**_scheduler_options)
+        _schedulers[loop] = scheduler
+
+    return scheduler
@@ -0,0 +1,276 @@
+"""Persistent session store for MessageHistory"""
+
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+from loguru import logger
+
+from utils.history_util import MessageHistory
+
+class SessionStore(ABC):
+    """Base class for session stores
+
+    append is called on the request path and must not block,
+    load is called once when a conversation resumes and must return
+    every message appended to that session before it, written or not
+    """
+
+    @abstractmethod
+    def append(self, session_id: str, message: Dict[str, Any], tokens: int) -> None:
+        """Queue one message of a session for persistence"""
+
+    @abstractmethod
+    def load(self, session_id: str, max_tokens: int | None = None) -> List[Tuple[Dict[str, Any], int]]:
+        """Latest messages of a session with their token counts, oldest first
+
+        With max_tokens, only the most recent messages that fit are returned
+        """
+
+    def flush(self) -> None:
+        """Wait until queued messages are written"""
+
+    def close(self) -> None:
+        """Flush and release resources"""
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite session store with batched background writes
+
+    Messages are appended to a queue and written by one writer thread in
+    batches, so adding a message never waits on disk
+    """
+
+    def __init__(self, path: str, batch_size: int = 128, flush_interval: float = 0.2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any], int, float] | None]" = queue.Queue()
+        self._local = threading.local()
+        # Queued messages per session, load waits for its session's to be written
+        self._pending: Dict[str, int] = {}
+        self._written = threading.Condition()
+
+        with sqlite3.connect(path) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+                CREATE TABLE IF NOT EXISTS tool_calls (
+                    session_id TEXT NOT NULL,
+                    tool_call_id TEXT NOT NULL,
+                    name TEXT,
+                    arguments TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, tool_call_id)
+                );
+            """)
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="session-store")
+        self._writer.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, sqlite3 connections can't be shared"""
+        if not hasattr(self._local, "db"):
+            self._local.db = sqlite3.connect(self.path)
+        return self._local.db
+
+    def append(self, session_id: str, message: Dict[str, Any], tokens: int) -> None:
+        with self._written:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._queue.put((session_id, message, tokens, time.time()))
+
+    def _write_loop(self) -> None:
+        db = self._connection()
+        stop = False
+
+        while not stop:
+            batch = []
+            item = self._queue.get()
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+
+            # Gather what else arrives shortly to write it in one transaction
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            try:
+                if batch:
+                    self._write_batch(db, batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} session messages: {e}")
+            finally:
+                with self._written:
+                    for session_id, *_ in batch:
+                        self._pending[session_id] -= 1
+                        if not self._pending[session_id]:
+                            del self._pending[session_id]
+                    self._written.notify_all()
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+        db.close()
+
+    @staticmethod
+    def _write_batch(db: sqlite3.Connection, batch: List[Tuple[str, Dict[str, Any], int, float]]) -> None:
+        messages = []
+        tool_calls = []
+        tool_results = []
+
+        for session_id, message, tokens, created_at in batch:
+            messages.append((session_id, message["role"], json.dumps(message), tokens, created_at))
+
+            for tool_call in message.get("tool_calls") or []:
+                tool_calls.append((
+                    session_id,
+                    tool_call["id"],
+                    tool_call["function"]["name"],
+                    tool_call["function"]["arguments"],
+                    created_at,
+                ))
+            if message["role"] == "tool" and message.get("tool_call_id"):
+                tool_results.append((str(message.get("content")), session_id, message["tool_call_id"]))
+
+        with db:
+            db.executemany(
+                "INSERT INTO messages (session_id, role, message, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                messages,
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO tool_calls (session_id, tool_call_id, name, arguments, created_at) VALUES (?, ?, ?, ?, ?)",
+                tool_calls,
+            )
+            db.executemany(
+                "UPDATE tool_calls SET result = ? WHERE session_id = ? AND tool_call_id = ?",
+                tool_results,
+            )
+
+    def load(self, session_id: str, max_tokens: int | None = None) -> List[Tuple[Dict[str, Any], int]]:
+        # A session evicted and resumed quickly may still have messages in the queue
+        with self._written:
+            self._written.wait_for(lambda: session_id not in self._pending)
+
+        rows = self._connection().execute(
+            "SELECT message, tokens FROM messages WHERE session_id = ? ORDER BY id DESC",
+            (session_id,),
+        )
+
+        result = []
+        total = 0
+        for message, tokens in rows:
+            if max_tokens is not None and total + tokens > max_tokens and result:
+                break
+            result.append((json.loads(message), tokens))
+            total += tokens
+
+        result.reverse()
+
+        # Start on a user message, so tool results are never separated from their call
+        while result and result[0][0]["role"] != "user":
+            result.pop(0)
+
+        return result
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join()
+
+class SessionManager:
+    """Keep recently used session histories in memory, load the others lazily
+
+    About max_sessions histories are held; the least recently used one is
+    evicted unless a turn or a background compaction is using it. Its messages
+    are queued to the store already, and a later load waits for them to be
+    written. Compaction summaries are not persisted: a reloaded session starts
+    from its most recent messages that fit the context window, without summary
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        history_factory: Callable[[], MessageHistory],
+        max_sessions: int = 1000,
+    ):
+        self.store = store
+        self.history_factory = history_factory
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, MessageHistory] = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Turns in progress per session, these histories are never evicted
+        self._active: Dict[str, int] = {}
+
+    async def _load(self, session_id: str) -> MessageHistory:
+        history = self.history_factory()
+        messages = await asyncio.to_thread(self.store.load, session_id, history.context_window_tokens)
+        history.restore(messages)
+        history.attach_store(self.store, session_id)
+        return history
+
+    async def get(self, session_id: str) -> MessageHistory:
+        """History of a session, loading it from the store on first use"""
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+            return self._sessions[session_id]
+
+        # Concurrent requests for the same session share one load
+        if session_id not in self._loading:
+            self._loading[session_id] = asyncio.create_task(self._load(session_id))
+        try:
+            history = await asyncio.shield(self._loading[session_id])
+        finally:
+            self._loading.pop(session_id, None)
+
+        self._sessions[session_id] = history
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+        return history
+
+    @asynccontextmanager
+    async def use(self, session_id: str) -> AsyncIterator[MessageHistory]:
+        """History of a session for one turn, kept in memory until the turn ends"""
+        self._active[session_id] = self._active.get(session_id, 0) + 1
+        try:
+            yield await self.get(session_id)
+        finally:
+            self._active[session_id] -= 1
+            if not self._active[session_id]:
+                del self._active[session_id]
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used idle histories while over max_sessions"""
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if session_id in self._active or self._sessions[session_id].compaction_running:
+                continue
+            del self._sessions[session_id]
+            logger.debug("Evicted session {} from memory", session_id)
@@ -0,0 +1,93 @@
+"""Incremental assembly of streamed tool calls"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+@dataclass
+class StreamedFunction:
+    """Function part of a streamed tool call, filled fragment by fragment"""
+
+    name: str = ""
+    arguments: str = ""
+
+@dataclass
+class StreamedToolCall:
+    """Tool call rebuilt from stream deltas
+
+    Exposes the same id / function.name / function.arguments attributes as
+    the non-streamed tool calls, so it can go straight into execute_tools
+    """
+
+    index: int
+    id: str = ""
+    type: str = "function"
+    function: StreamedFunction = field(default_factory=StreamedFunction)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the assistant message tool_calls format"""
+        return {
+            "id": self.id,
+            "type": self.type,
+            "function": {
+                "name": self.function.name,
+                "arguments": self.function.arguments,
+            },
+        }
+
+def _arguments_complete(arguments: str) -> bool:
+    """Arguments are a JSON object, so once they parse no later fragment can extend them"""
+    if not arguments.rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(arguments)
+        return True
+    except ValueError:
+        return False
+
+class ToolCallAssembler:
+    """Assemble tool-call fragments and report each call as soon as it is complete"""
+
+    def __init__(self):
+        self.calls: Dict[int, StreamedToolCall] = {}
+        self._completed: set[int] = set()
+
+    def feed(self, deltas: List[Any] | None) -> List[StreamedToolCall]:
+        """Consume the tool_calls deltas of one chunk, return calls completed by it"""
+        completed = []
+
+        for delta in deltas or []:
+            index = delta.index
+
+            if index not in self.calls:
+                # A new call starting means every earlier one has all its fragments
+                completed.extend(self._complete(i) for i in list(self.calls) if i < index)
+                self.calls[index] = StreamedToolCall(index=index)
+
+            call = self.calls[index]
+            if delta.id:
+                call.id = delta.id
+            if delta.function:
+                if delta.function.name:
+                    call.function.name += delta.function.name
+                if delta.function.arguments:
+                    call.function.arguments += delta.function.arguments
+
+            if index not in self._completed and call.id and call.function.name and _arguments_complete(call.function.arguments):
+                completed.append(self._complete(index))
+
+        return [call for call in completed if call is not None]
+
+    def finish(self) -> List[StreamedToolCall]:
+        """End of stream, every remaining call is complete"""
+        return [call for call in (self._complete(i) for i in list(self.calls)) if call is not None]
+
+    def ordered_calls(self) -> List[StreamedToolCall]:
+        """All calls of the response in the order the model emitted them"""
+        return [self.calls[i] for i in sorted(self.calls)]
+
+    def _complete(self, index: int) -> StreamedToolCall | None:
+        if index in self._completed:
+            return None
+        self._completed.add(index)
+        return self.calls[index]
@@ -0,0 +1,315 @@
+"""Per-turn tracing and metrics export for the agent loop"""
+
+import contextvars
+import json
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+
+from loguru import logger
+
+# Latency buckets in seconds for the Prometheus histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def preview(value: Any, limit: int = 200) -> str:
+    """Short version of a payload for logs"""
+    text = str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
+
+@dataclass
+class ToolSpan:
+    """One tool call inside a turn"""
+
+    name: str
+    latency: float
+    outcome: str
+
+@dataclass
+class TurnSpan:
+    """One agent turn, from user input to final answer"""
+
+    agent: str
+    turn_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    start: float = field(default_factory=time.time)
+    duration: float = 0.0
+    model_calls: int = 0
+    model_latency: float = 0.0
+    # Time to the first streamed token of the first model call
+    ttft: float | None = None
+    tokens_in: int = 0
+    tokens_out: int = 0
+    cached_tokens: int = 0
+    truncations: int = 0
+    tools: List[ToolSpan] = field(default_factory=list)
+    error: str | None = None
+
+    def record_model_call(self, latency: float, usage: Any, ttft: float | None = None) -> None:
+        self.model_calls += 1
+        self.model_latency += latency
+        if self.ttft is None:
+            self.ttft = latency if ttft is None else ttft
+        if usage:
+            self.tokens_in += usage.prompt_tokens or 0
+            self.tokens_out += usage.completion_tokens or 0
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+    def record_tool(self, name: str, latency: float, outcome: str) -> None:
+        self.tools.append(ToolSpan(name, latency, outcome))
+
+# Span of the turn running in the current task, tool tasks inherit it
+current_span: contextvars.ContextVar[TurnSpan | None] = contextvars.ContextVar("current_span", default=None)
+
+def record_model_call(latency: float, usage: Any, ttft: float | None = None) -> None:
+    """Record a model call on the current turn, if it is traced"""
+    if (span := current_span.get()) is not None:
+        span.record_model_call(latency, usage, ttft)
+
+def record_tool(name: str, latency: float, outcome: str) -> None:
+    """Record a tool call on the current turn, if it is traced"""
+    if (span := current_span.get()) is not None:
+        span.record_tool(name, latency, outcome)
+
+def record_truncation() -> None:
+    """Record a history truncation on the current turn, if it is traced"""
+    if (span := current_span.get()) is not None:
+        span.truncations += 1
+
+class JSONLExporter:
+    """Append finished spans to a JSONL file from a background writer thread
+
+    export only queues the span, the writer appends what arrives within
+    flush_interval in one write, so a turn never waits on disk
+    """
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any] | None]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="jsonl-exporter")
+        self._writer.start()
+
+    def export(self, span: TurnSpan) -> None:
+        # Copied now, the writer serializes it later
+        self._queue.put(asdict(span))
+
+    def _write_loop(self) -> None:
+        stop = False
+
+        while not stop:
+            batch = []
+            item = self._queue.get()
+            if item is None:
+                stop = True
+            else:
+                batch.append(item)
+
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            try:
+                if batch:
+                    lines = "".join(json.dumps(record) + "\n" for record in batch)
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(lines)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} spans to {self.path}: {e}")
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Wait until every exported span is written"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write what is queued and stop the writer"""
+        self._queue.put(None)
+        self._writer.join()
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}'
+            for bound, count in zip(LATENCY_BUCKETS, self.buckets)
+        ]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class PrometheusExporter:
+    """Aggregate spans into counters and histograms in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.errors = 0
+        self.truncations = 0
+        self.tokens: Dict[str, int] = {"in": 0, "out": 0, "cached": 0}
+        self.turn_latency = _Histogram()
+        self.model_latency = _Histogram()
+        self.ttft = _Histogram()
+        self.tool_latency: Dict[str, _Histogram] = {}
+        self.tool_outcomes: Dict[tuple, int] = {}
+        self._server: ThreadingHTTPServer | None = None
+
+    def export(self, span: TurnSpan) -> None:
+        with self._lock:
+            self.turns += 1
+            self.errors += span.error is not None
+            self.truncations += span.truncations
+            self.tokens["in"] += span.tokens_in
+            self.tokens["out"] += span.tokens_out
+            self.tokens["cached"] += span.cached_tokens
+            self.turn_latency.observe(span.duration)
+            if span.model_calls:
+                self.model_latency.observe(span.model_latency / span.model_calls)
+            if span.ttft is not None:
+                self.ttft.observe(span.ttft)
+            for tool in span.tools:
+                self.tool_latency.setdefault(tool.name, _Histogram()).observe(tool.latency)
+                key = (tool.name, tool.outcome)
+                self.tool_outcomes[key] = self.tool_outcomes.get(key, 0) + 1
+
+    def render(self) -> str:
+        """Current metrics in Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# TYPE agent_turns_total counter",
+                f"agent_turns_total {self.turns}",
+                "# TYPE agent_turn_errors_total counter",
+                f"agent_turn_errors_total {self.errors}",
+                "# TYPE agent_truncations_total counter",
+                f"agent_truncations_total {self.truncations}",
+                "# TYPE agent_tokens_total counter",
+                *[f'agent_tokens_total{{kind="{kind}"}} {count}' for kind, count in self.tokens.items()],
+                "# TYPE agent_turn_latency_seconds histogram",
+                *self.turn_latency.render("agent_turn_latency_seconds"),
+                "# TYPE agent_model_latency_seconds histogram",
+                *self.model_latency.render("agent_model_latency_seconds"),
+                "# TYPE agent_ttft_seconds histogram",
+                *self.ttft.render("agent_ttft_seconds"),
+                "# TYPE agent_tool_latency_seconds histogram",
+            ]
+            for name, histogram in self.tool_latency.items():
+                lines.extend(histogram.render("agent_tool_latency_seconds", f'tool="{name}"'))
+            lines.append("# TYPE agent_tool_calls_total counter")
+            for (name, outcome), count in self.tool_outcomes.items():
+                lines.append(f'agent_tool_calls_total{{tool="{name}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> None:
+        """Serve /metrics from a background thread"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+        logger.info(f"Serving agent metrics on {host}:{port}/metrics")
+
+class Tracer:
+    """Create turn spans and hand finished ones to the exporters"""
+
+    def __init__(self, exporters: List[Any] | None = None):
+        self.exporters = list(exporters or [])
+
+    @contextmanager
+    def turn(self, agent: str) -> Iterator[TurnSpan]:
+        """Trace one turn, model and tool calls inside it are recorded on the span"""
+        span = TurnSpan(agent=agent)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_turn(span, e)
+            raise
+        else:
+            self.end_turn(span)
+        finally:
+            current_span.reset(token)
+
+    def end_turn(self, span: TurnSpan, error: BaseException | None = None) -> None:
+        span.duration = time.time() - span.start
+        if error is not None:
+            span.error = f"{type(error).__name__}: {preview(error)}"
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.error(f"Error exporting span: {e}")
+
+    def flush(self) -> None:
+        """Wait for exporters that write in the background"""
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush()
+
+_tracer = Tracer()
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer used by agents"""
+    return _tracer
+
+def configure_tracing(jsonl_path: str | None = None, prometheus_port: int | None = None) -> Tracer:
+    """Export spans to a JSONL file and / or a Prometheus /metrics endpoint"""
+    exporters: List[Any] = []
+
+    for exporter in _tracer.exporters:
+        # Writes what the previous JSONL exporter still has queued
+        if isinstance(exporter, JSONLExporter):
+            exporter.close()
+
+    if jsonl_path:
+        exporters.append(JSONLExporter(jsonl_path))
+    if prometheus_port is not None:
+        prometheus = PrometheusExporter()
+        prometheus.serve(prometheus_port)
+        exporters.append(prometheus)
+
+    _tracer.exporters = exporters
+    return _tracer
@@ -0,0 +1,146 @@
+"""Process-wide tokenizer registry
+
+Encodings are loaded once per process and shared by every history. Loading reads
+or downloads the BPE file, so agents warm their encoding with warm_tokenizer
+off the event loop before a turn counts tokens. Model or deployment names unknown to tiktoken use the default
+encoding. Offline hosts can seed the tiktoken cache from a directory of
+`<encoding>.tiktoken` files, with TOKENIZER_DIR or seed_from_directory.
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, List
+
+from loguru import logger
+
+import tiktoken
+
+DEFAULT_ENCODING = os.getenv("TOKENIZER_DEFAULT_ENCODING", "o200k_base")
+# Where tiktoken downloads the BPE files from, the cache key is the sha1 of the URL
+ENCODINGS_URL = "https://openaipublic.blob.core.windows.net/encodings"
+
+def seed_from_directory(path: str) -> List[str]:
+    """Make local BPE files available to tiktoken without network
+
+    path holds either `<encoding>.tiktoken` files, which are copied into the
+    tiktoken cache under the name tiktoken looks for, or is a tiktoken cache
+    directory itself. Returns the seeded encoding names.
+    """
+    files = [name for name in os.listdir(path) if name.endswith(".tiktoken")]
+    if not files:
+        os.environ["TIKTOKEN_CACHE_DIR"] = path
+        logger.info(f"Using {path} as tiktoken cache")
+        return []
+
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    for file_name in files:
+        cache_key = hashlib.sha1(f"{ENCODINGS_URL}/{file_name}".encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, cache_key)
+        if not os.path.exists(cache_path):
+            shutil.copyfile(os.path.join(path, file_name), cache_path)
+
+    os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    seeded = [file_name.removesuffix(".tiktoken") for file_name in files]
+    logger.info(f"Seeded tiktoken cache {cache_dir} with {', '.join(seeded)}")
+    return seeded
+
+class TokenizerRegistry:
+    """Load each encoding once, lazily, and share it between threads
+
+    An encoding that fails to load is remembered as unavailable, so counting
+    falls back to an estimate instead of retrying the download every time
+    """
+
+    def __init__(self, default_encoding: str = DEFAULT_ENCODING, model_encodings: Dict[str, str] | None = None):
+        self.default_encoding = default_encoding
+        # Explicit model or deployment name -> encoding name
+        self.model_encodings = dict(model_encodings or {})
+        self._encodings: Dict[str, Any] = {}
+        self._resolved: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def encoding_name_for(self, model: str | None) -> str:
+        """Encoding name of a model, the default one for unknown names"""
+        if not model:
+            return self.default_encoding
+        if model in self._resolved:
+            return self._resolved[model]
+
+        if model in self.model_encodings:
+            name = self.model_encodings[model]
+        else:
+            try:
+                name = tiktoken.encoding_name_for_model(model)
+            except KeyError:
+                name = self.default_encoding
+        self._resolved[model] = name
+        return name
+
+    def is_loaded(self, model: str | None = None) -> bool:
+        """True once the encoding of a model was loaded, or found unavailable"""
+        return self.encoding_name_for(model) in self._encodings
+
+    async def warm(self, model: str | None = None) -> None:
+        """Load the encoding of a model in a worker thread, not on the event loop"""
+        if not self.is_loaded(model):
+            await asyncio.to_thread(self.get, model)
+
+    def get(self, model: str | None = None) -> Any:
+        """Encoding of a model, None if it can't be loaded"""
+        name = self.encoding_name_for(model)
+        if name in self._encodings:
+            return self._encodings[name]
+
+        with self._lock:
+            if name not in self._encodings:
+                try:
+                    self._encodings[name] = tiktoken.get_encoding(name)
+                    logger.info(f"Loaded tokenizer {name}")
+                except Exception as e:
+                    logger.warning(f"Tokenizer {name} unavailable, estimating token counts: {e}")
+                    self._encodings[name] = None
+        return self._encodings[name]
+
+    def count(self, text: str, model: str | None = None) -> int:
+        """Token count of a text, len(text) // 4 if the encoding is unavailable"""
+        if not text:
+            return 0
+        if (encoding := self.get(model)) is None:
+            return len(text) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+_registry = TokenizerRegistry()
+
+if os.getenv("TOKENIZER_DIR"):
+    seed_from_directory(os.environ["TOKENIZER_DIR"])
+
+def get_tokenizer_registry() -> TokenizerRegistry:
+    """Process-wide registry used by MessageHistory"""
+    return _registry
+
+def configure_tokenizers(
+    default_encoding: str = DEFAULT_ENCODING,
+    model_encodings: Dict[str, str] | None = None,
+    seed_dir: str | None = None,
+) -> TokenizerRegistry:
+    """Replace the process-wide registry, e.g. to map deployment names or seed offline encodings"""
+    global _registry
+    if seed_dir:
+        seed_from_directory(seed_dir)
+    _registry = TokenizerRegistry(default_encoding=default_encoding, model_encodings=model_encodings)
+    logger.info(f"Tokenizers configured: default={default_encoding}, models={model_encodings}")
+    return _registry
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Token count of a text with the process-wide registry"""
+    return _registry.count(text, model)
+
+async def warm_tokenizer(model: str | None = None) -> None:
+    """Load the encoding of a model off the event loop, a no-op once loaded"""
+    await _registry.warm(model)
@@ -1,39 +1,81 @@
 """Tool Execution with parallel execution support"""
 
 import asyncio
+import time
 from typing import Any, Dict, List
 
 import json
 
+from utils.cache_util import ToolResultCache, get_tool_cache
+from utils.scheduler import ToolScheduler, ToolCancelledError, ToolTimeoutError, get_tool_scheduler
+from utils.telemetry import record_tool
+
 async def _execute_single_tool(
     call:Any,
-    tool_dict: Dict[str,Any]
+    tool_dict: Dict[str,Any],
+    cache: ToolResultCache | None = None,
+    scheduler: ToolScheduler | None = None,
 ) -> Dict[str, Any]:
-    """Execute a single tool and handle errors"""
+    """Execute a single tool and handle errors
+    
+    Cacheable tools are looked up in the cache first, errors are never cached.
+    Timeouts and cancellations are returned to the model as the tool result
+    """
     response = {"role": "tool","tool_call_id": call.id, "name": call.function.name, "content": None}
     
     try:
-        result = await tool_dict[call.function.name].execute(**json.loads(call.function.arguments))
-        response["content"] = result
+        tool = tool_dict[call.function.name]
     except KeyError:
         response["content"] = f"Tool {call.function.name} not found"
+        record_tool(call.function.name, 0.0, "not_found")
+        return response
+    
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        arguments = json.loads(call.function.arguments)
+        scheduler = scheduler or get_tool_scheduler()
+        
+        if cache is not None and tool.cacheable:
+            result = await cache.get_or_execute(
+                cache.make_key(tool.name, arguments),
+                tool.cache_ttl,
+                lambda: scheduler.run(tool, arguments, call.id),
+            )
+        else:
+            result = await scheduler.run(tool, arguments, call.id)
+        response["content"] = result
+    except (ToolTimeoutError, ToolCancelledError) as e:
+        outcome = "timeout" if isinstance(e, ToolTimeoutError) else "cancelled"
+        response["content"] = f"Error: {str(e)}"
     except Exception as e:
+        outcome = "error"
         response["content"] = f"Error executing tool {call.function.name}: {str(e)}"
     
+    record_tool(tool.name, time.perf_counter() - started, outcome)
     return response
 
 async def execute_tools(
     calls: List[Any],
     tool_dict: Dict[str, Any],
     parallel: bool = True,
+    cache: ToolResultCache | None = None,
+    scheduler: ToolScheduler | None = None,
 ) -> List[Dict[str, Any]]:
-    """Execute a list of tool calls in parallel or sequentially"""
+    """Execute a list of tool calls in parallel or sequentially
+    
+    cache defaults to the process-wide tool result cache and scheduler to the
+    tool scheduler of the running event loop, which bounds concurrency and time
+    """
+    cache = cache or get_tool_cache()
+    scheduler = scheduler or get_tool_scheduler()
+    
     if parallel:
         return await asyncio.gather(
-            *[_execute_single_tool(call, tool_dict) for call in calls]
+            *[_execute_single_tool(call, tool_dict, cache, scheduler) for call in calls]
         )
     else:
         return [
-            await _execute_single_tool(call, tool_dict)
+            await _execute_single_tool(call, tool_dict, cache, scheduler)
             for call in calls
         ]
\ No newline at end of file
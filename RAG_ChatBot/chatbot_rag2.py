@@ -1,52 +1,128 @@
 from langchain_ollama import ChatOllama
 from langchain_chroma import Chroma
 from langchain_ollama import OllamaEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever,create_retrieval_chain
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.messages import convert_to_messages
+from langchain_core.runnables import RunnableLambda
 import streamlit as st
 import os
 
+from index_manifest import IndexManifest, settings_key
+from ingest_pipeline import IngestConfig, ingest_pdfs
+from embedding_cache import CachedEmbeddings
+from query_rewrite import build_context_retriever
+from vector_index import MmapVectorStore
+from context_packing import pack_documents
+from hybrid_retrieval import BM25Index, HybridRetriever, sync_index
+
 st.title("RAG Chatbot Chem v2")
 
-def createVectorDB(folder_path):
-    # Load all pdf from the folder path
-    loaders = [PyPDFLoader(os.path.join(folder_path,file)) for file in os.listdir(folder_path) if file.endswith(".pdf")]
-    
-    # Loead each pdf
-    # Split each pdf
-    # Concatenate to one list
-    # Embed to VectorDB
-    all_documents = []
-
-    for loader in loaders:
-        # load each pdf
-        raw_document = loader.load()
-
-        # Splitter for chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200, add_start_index=True
-        )
-
-        # Splitted document and concatenate them
-        documents = text_splitter.split_documents(raw_document)
-        all_documents.extend(documents)
-
-    # Embedding model
-    local_embeddings = OllamaEmbeddings(model="nomic-embed-text")
-
-    if not os.path.exists(os.path.join(os.path.dirname(__file__),"/vectordb1")):
-        os.makedirs(os.path.join(os.path.dirname(__file__),"/vectordb1"))
-
-    # Resulting vectorDB
-    vectorstore = Chroma.from_documents(
-        documents=all_documents, 
-        embedding=local_embeddings, 
-        persist_directory=os.path.join(os.path.dirname(__file__),"/vectordb1"),
-        collection_name='v_db')
+# Chunks depend on these, changing them re-indexes every file
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+VECTORDB_DIR = os.path.join(os.path.dirname(__file__), "vectordb1")
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+# Shared by every collection, vectors are keyed by model and chunk text
+EMBEDDING_CACHE_DIR = os.path.join(os.path.dirname(__file__), "embedding_cache")
+EMBEDDING_MODEL = "nomic-embed-text"
+LLM_MODEL = "llama3.2"
+# "chroma", or "mmap" for the in-process memory-mapped index (vector_index.py)
+VECTOR_BACKEND = "chroma"
+# Also retrieve the raw question while the LLM reformulates it, and merge the results
+CONCURRENT_REFORMULATION = False
+# Tokens of retrieved context in the prompt, after merging overlapping chunks
+CONTEXT_TOKEN_BUDGET = 1500
+# Fuse BM25 and vector hits, identifier queries (formulas, CAS numbers) skip the embedder
+HYBRID_RETRIEVAL = True
+
+def createVectorDB(folder_path, persist_directory=VECTORDB_DIR, ingest_config=None, embeddings=None):
+    # Only new or changed pdf are loaded, split and embedded, an unchanged
+    # folder just opens the persisted collection without any embedding call
+    # Each backend keeps its own files and manifest
+    if VECTOR_BACKEND != "chroma":
+        persist_directory = os.path.join(persist_directory, VECTOR_BACKEND)
+    os.makedirs(persist_directory, exist_ok=True)
+
+    # Embedding model, behind a cache so known chunks are never embedded twice
+    local_embeddings = embeddings or CachedEmbeddings(
+        OllamaEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL, EMBEDDING_CACHE_DIR)
+
+    if VECTOR_BACKEND == "mmap":
+        vectorstore = MmapVectorStore(
+            embedding_function=local_embeddings,
+            persist_directory=persist_directory)
+    else:
+        vectorstore = Chroma(
+            embedding_function=local_embeddings,
+            persist_directory=persist_directory,
+            collection_name='v_db')
+
+    manifest = IndexManifest(os.path.join(persist_directory, "manifest.json"))
+    # BM25 index of the same chunks, kept in step with the vector store
+    lexical_index = BM25Index(os.path.join(persist_directory, "bm25.json"))
+    settings = settings_key(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+
+    # A collection built before the manifest existed has random ids, start over
+    if not manifest.exists:
+        vectorstore.reset_collection()
+
+    files = {
+        file: manifest.content_hash(file, os.path.join(folder_path, file))
+        for file in os.listdir(folder_path) if file.endswith(".pdf")
+    }
+    changes = manifest.diff(files, settings)
+
+    # Delete the chunks of removed and changed pdf
+    stale_ids = [
+        chunk_id
+        for file in changes.removed + changes.changed
+        for chunk_id in manifest.entries[file].chunk_ids
+    ]
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+        lexical_index.delete(stale_ids)
+    for file in changes.removed:
+        manifest.remove(file)
+
+    def file_done(file, path, ids):
+        # Saved after each file, so an interrupted run keeps what is done
+        manifest.set(file, path, files[file], settings, ids)
+        manifest.save()
+
+    # Load and split the pdf in parallel, embed and write the chunks in batches
+    report = ingest_pdfs(
+        vectorstore,
+        [(file, os.path.join(folder_path, file)) for file in changes.added + changes.changed],
+        chunk_ids=lambda file, count: manifest.chunk_ids(file, files[file], settings, count),
+        on_file_done=file_done,
+        config=ingest_config or IngestConfig(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP),
+        on_batch_done=lambda documents, ids: lexical_index.add(ids, [d.page_content for d in documents]),
+    )
+
+    # Unreadable pdf stay out of the manifest, so the next run tries them again
+    for file in report.failed:
+        manifest.remove(file)
+    if changes.removed or report.failed:
+        manifest.save()
+
+    # Chunks indexed before the BM25 index existed, or by an interrupted run, are read back
+    indexed_ids = [chunk_id for entry in manifest.entries.values() for chunk_id in entry.chunk_ids]
+    if sync_index(lexical_index, vectorstore, indexed_ids) or changes.added or changes.changed or stale_ids:
+        lexical_index.save()
+
+    print(
+        f"Vector DB: {len(set(changes.added) - set(report.failed))} added, "
+        f"{len(set(changes.changed) - set(report.failed))} changed, "
+        f"{len(changes.removed)} removed, {len(changes.unchanged)} unchanged, "
+        f"{len(report.failed)} failed"
+    )
+    for file, error in report.failed.items():
+        print(f"  {file} skipped: {error}")
+    if HYBRID_RETRIEVAL:
+        return HybridRetriever(vectorstore=vectorstore, index=lexical_index, k=3)
     return vectorstore.as_retriever(search_kwargs={"k":3})
 
 #if "vector_db" not in st.session_state:
@@ -57,20 +133,29 @@ def createVectorDB(folder_path):
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "retriever" not in st.session_state: 
-    st.session_state.retriever = createVectorDB(os.path.join(os.path.dirname(__file__),"/resources"))
 
+# Resources below are built once per process and shared by every session,
+# only the chat history and the prompt change between calls
 
-def RAG_Stream(prompt):
+@st.cache_resource
+def get_llm():
+    return ChatOllama(model=LLM_MODEL)
 
-    #vector_db = st.session_state.vector_db
-    #vector_db = createVectorDB(os.path.join(os.getcwd(),"LLMenv/resources"))
-    messages = st.session_state.messages
+@st.cache_resource
+def get_embeddings():
+    # Embedding model, behind a cache so known chunks are never embedded twice
+    return CachedEmbeddings(
+        OllamaEmbeddings(model=EMBEDDING_MODEL), EMBEDDING_MODEL, EMBEDDING_CACHE_DIR)
+
+@st.cache_resource
+def get_retriever():
+    return createVectorDB(RESOURCES_DIR, embeddings=get_embeddings())
+
+@st.cache_resource
+def get_rag_chain():
+    llm = get_llm()
+    retriever = get_retriever()
 
-    llm = ChatOllama(model="llama3.2")
-    
-    retriever = st.session_state.retriever
-    #print(retriever.invoke("Organic"))
     contextualize_q_system_prompt = (
         "Given a chat history and the latest user question "
         "which might reference context in the chat history, "
@@ -86,8 +171,9 @@ def RAG_Stream(prompt):
         ]
     )
 
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
+    # The question is only reformulated by the LLM when it refers to the chat history
+    history_aware_retriever = build_context_retriever(
+        llm, retriever, contextualize_q_prompt, concurrent=CONCURRENT_REFORMULATION
     )
 
     ### Answer question ###
@@ -109,9 +195,19 @@ def RAG_Stream(prompt):
 
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
 
+    # Merge overlapping hits, drop repeated text and keep the context within budget
+    context_retriever = history_aware_retriever | RunnableLambda(
+        lambda documents: pack_documents(documents, max_tokens=CONTEXT_TOKEN_BUDGET)
+    )
+
+    return create_retrieval_chain(context_retriever, question_answer_chain)
+
 
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+def RAG_Stream(prompt):
+
+    messages = st.session_state.messages
 
+    rag_chain = get_rag_chain()
 
     if messages == []:
         chat_history = []
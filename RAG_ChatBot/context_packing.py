@@ -0,0 +1,127 @@
+"""Token-budgeted packing of retrieved chunks
+
+Chunks are split with an overlap, so neighbouring hits from the same page
+repeat up to chunk_overlap characters each. Packing merges overlapping or
+adjacent chunks of a page back together using their start_index, drops
+repeated text, keeps the most relevant passages first and cuts the result to
+a token budget, so the prompt sent to the model stays small.
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about 4 characters per token for English text"""
+    return (len(text) + 3) // 4
+
+@dataclass
+class _Passage:
+    """Contiguous text of one page, built from one or more chunks"""
+
+    source: Tuple
+    start: int
+    text: str
+    rank: int
+    metadata: Dict = field(default_factory=dict)
+    # Offset of the end of text on the page
+    end: int = -1
+
+    def __post_init__(self):
+        if self.end < 0:
+            self.end = self.start + len(self.text)
+
+# Chunks this close are adjacent, the splitter strips the whitespace between them
+MAX_GAP = 2
+
+def _merge(passage: _Passage, document: Document, start: int, rank: int) -> bool:
+    """Extend passage with an overlapping or adjacent chunk, False if they don't touch"""
+    text = document.page_content
+    end = start + len(text)
+    if start > passage.end + MAX_GAP:
+        return False
+
+    if start >= passage.end:
+        passage.text += " " + text
+    elif end > passage.end:
+        overlap = passage.end - start
+        # start_index is computed on the page, but check the text before trusting it
+        if not passage.text.endswith(text[:overlap]):
+            return False
+        passage.text += text[overlap:]
+    # else the chunk is inside the passage already
+
+    passage.end = max(passage.end, end)
+    passage.rank = min(passage.rank, rank)
+    return True
+
+def _cut(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Longest prefix within max_tokens, ending at a sentence or word if possible"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    prefix = text[:low]
+    for boundary in (". ", "\n", " "):
+        if (position := prefix.rfind(boundary)) > len(prefix) // 2:
+            return prefix[:position + 1].rstrip()
+    return prefix
+
+def pack_documents(
+    documents: List[Document],
+    max_tokens: int = 1500,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    min_tail_tokens: int = 50,
+) -> List[Document]:
+    """Merge, de-duplicate, order by relevance and trim retrieved chunks to max_tokens
+
+    documents are in retrieval order, best first. A passage that doesn't fit
+    entirely is cut if at least min_tail_tokens of it fit, then packing stops.
+    """
+    # Chunks of the same page, in page order, become passages
+    by_page: Dict[Tuple, List[Tuple[int, int, Document]]] = {}
+    loose: List[_Passage] = []
+    for rank, document in enumerate(documents):
+        metadata = document.metadata or {}
+        if "start_index" in metadata:
+            page = (metadata.get("source"), metadata.get("page"))
+            by_page.setdefault(page, []).append((metadata["start_index"], rank, document))
+        else:
+            loose.append(_Passage((None, rank), 0, document.page_content, rank, dict(metadata)))
+
+    passages = list(loose)
+    for page, chunks in by_page.items():
+        chunks.sort(key=lambda chunk: (chunk[0], chunk[1]))
+        current = None
+        for start, rank, document in chunks:
+            if current is not None and _merge(current, document, start, rank):
+                continue
+            current = _Passage(page, start, document.page_content, rank, dict(document.metadata))
+            passages.append(current)
+
+    # Most relevant first, repeated text (same header on every page, same pdf twice) once
+    passages.sort(key=lambda passage: passage.rank)
+    kept: List[_Passage] = []
+    for passage in passages:
+        text = " ".join(passage.text.split())
+        if text and not any(text in " ".join(other.text.split()) for other in kept):
+            kept.append(passage)
+
+    packed = []
+    budget = max_tokens
+    for passage in kept:
+        text = passage.text
+        tokens = count_tokens(text)
+        if tokens > budget:
+            if budget < min_tail_tokens:
+                break
+            text = _cut(text, budget, count_tokens)
+            packed.append(Document(page_content=text, metadata=passage.metadata))
+            break
+        packed.append(Document(page_content=text, metadata=passage.metadata))
+        budget -= tokens
+    return packed
@@ -0,0 +1,158 @@
+"""On-disk embedding cache
+
+Vectors are stored per embedding model in a memory-mapped float16 (or float32)
+matrix, one row per chunk, looked up by the hash of the chunk text. Re-ingested
+or overlapping PDFs, and repeated questions, are served without calling the
+model, and the cache is shared by every collection using the same model.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class EmbeddingStore:
+    """Append-only vector file with a key file alongside
+
+    vectors.bin holds the rows, keys.bin the 16-byte key of each row in the
+    same order. Rows are written before their key, so a crash can only leave
+    a trailing row without key, which is dropped on the next open.
+    """
+
+    KEY_SIZE = 16
+
+    def __init__(self, directory: str, dtype: str = "float16"):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.keys_path = os.path.join(directory, "keys.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.dtype = np.dtype(dtype)
+        self.dim: int | None = None
+        self.index: Dict[bytes, int] = {}
+        self._vectors: np.memmap | None = None
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            # The file decides, the constructor argument only applies to new stores
+            self.dtype = np.dtype(meta["dtype"])
+            self.dim = meta["dim"]
+            self._open()
+
+    @property
+    def count(self) -> int:
+        return len(self.index)
+
+    def _open(self) -> None:
+        with open(self.keys_path, "ab+") as f:
+            f.seek(0)
+            keys = f.read()
+        row_size = self.dim * self.dtype.itemsize
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys) // self.KEY_SIZE, vectors_size // row_size)
+
+        # Drop what a crash left half written
+        with open(self.keys_path, "ab") as f:
+            f.truncate(rows * self.KEY_SIZE)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * row_size)
+
+        self.index = {keys[i * self.KEY_SIZE:(i + 1) * self.KEY_SIZE]: i for i in range(rows)}
+        self._vectors = None
+
+    def _matrix(self) -> np.memmap:
+        # Mapped again after appends, mapping is cheap and pages stay in the OS cache
+        if self._vectors is None or self._vectors.shape[0] != self.count:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+        return self._vectors
+
+    def get(self, keys: List[bytes]) -> Dict[int, np.ndarray]:
+        """Cached vectors by position in keys, misses are left out"""
+        with self._lock:
+            rows = {i: self.index[key] for i, key in enumerate(keys) if key in self.index}
+            if not rows:
+                return {}
+            matrix = self._matrix()
+            return {i: np.asarray(matrix[row], dtype=np.float32) for i, row in rows.items()}
+
+    def put(self, keys: List[bytes], vectors: List[List[float]]) -> None:
+        """Append new vectors, keys already stored are skipped"""
+        with self._lock:
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.index:
+                    new[key] = vector
+            if not new:
+                return
+
+            if self.dim is None:
+                self.dim = len(next(iter(new.values())))
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+
+            matrix = np.asarray(list(new.values()), dtype=self.dtype).reshape(len(new), self.dim)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+
+            for key in new:
+                self.index[key] = len(self.index)
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper serving cached vectors and embedding the misses in one batch"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: str, dtype: str = "float16"):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        # One store per model, whatever collection uses it
+        self.store = EmbeddingStore(os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name)), dtype)
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> bytes:
+        # Some models embed queries and documents differently
+        digest = hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode())
+        return digest.digest()[:EmbeddingStore.KEY_SIZE]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", text) for text in texts]
+        found = self.store.get(keys)
+
+        # Identical chunks in one batch are embedded once
+        missing: Dict[bytes, str] = {}
+        for i, key in enumerate(keys):
+            if i not in found:
+                missing.setdefault(key, texts[i])
+
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+
+        computed: Dict[bytes, List[float]] = {}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.store.put(list(computed), list(computed.values()))
+
+        return [
+            found[i].tolist() if i in found else list(computed[key])
+            for i, key in enumerate(keys)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        if (found := self.store.get([key])):
+            self.hits += 1
+            return found[0].tolist()
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self.store.put([key], [vector])
+        return vector
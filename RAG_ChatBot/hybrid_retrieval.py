@@ -0,0 +1,189 @@
+"""Hybrid lexical and vector retrieval
+
+A BM25 inverted index is built while the PDFs are ingested and persisted next
+to the vector store. Queries combine BM25 and vector hits with reciprocal-rank
+fusion, so exact chemical names and formulas are found even when their
+embedding is not close, and queries made mostly of identifiers ("H2SO4",
+"7732-18-5") are answered from the inverted index without embedding them.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Words, numbers and identifiers such as H2SO4, 2,4-dinitrophenol or 7732-18-5
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:[-,.'][^\W_]+)*")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was",
+    "what", "when", "where", "which", "who", "why", "with",
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms, compound identifiers are kept whole and also split in parts"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        terms.append(token)
+        parts = re.split(r"[-,.']", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOP_WORDS)
+    return terms
+
+def is_identifier(token: str) -> bool:
+    """Formula, CAS number or other code: letters and digits mixed, or digit groups joined"""
+    has_digit = any(char.isdigit() for char in token)
+    return has_digit and (any(char.isalpha() for char in token) or bool(re.search(r"\d[-,.]\d", token)))
+
+def is_identifier_query(query: str) -> bool:
+    """True when at least half of the query terms are identifiers, then BM25 alone is enough"""
+    tokens = [token for token in TOKEN_PATTERN.findall(query.lower()) if token not in STOP_WORDS]
+    if not tokens:
+        return False
+    return sum(is_identifier(token) for token in tokens) * 2 >= len(tokens)
+
+class BM25Index:
+    """In-memory BM25 inverted index, saved as JSON"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # Term frequencies of every document, the postings are derived from them
+        self.documents: Dict[str, Dict[str, int]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for doc_id, terms in json.load(f).items():
+                    self._add(doc_id, terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.documents
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _add(self, doc_id: str, terms: Dict[str, int]) -> None:
+        self.documents[doc_id] = terms
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        """Index documents, an existing id is replaced"""
+        with self._lock:
+            self.delete([doc_id for doc_id in ids if doc_id in self.documents])
+            for doc_id, text in zip(ids, texts):
+                self._add(doc_id, dict(Counter(tokenize(text))))
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                terms = self.documents.pop(doc_id, None)
+                if terms is None:
+                    continue
+                self.total_length -= self.lengths.pop(doc_id)
+                for term in terms:
+                    posting = self.postings[term]
+                    del posting[doc_id]
+                    if not posting:
+                        del self.postings[term]
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """(id, BM25 score) of the k best documents"""
+        with self._lock:
+            if not self.documents:
+                return []
+            count = len(self.documents)
+            average_length = self.total_length / count
+            scores: Dict[str, float] = {}
+
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, frequency in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def save(self) -> None:
+        """Write the index atomically"""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.documents, f)
+            os.replace(tmp_path, self.path)
+
+def sync_index(index: BM25Index, vectorstore, ids: Iterable[str], batch_size: int = 256) -> bool:
+    """Make the index hold exactly ids, missing chunks are read back from the vector store
+
+    Covers stores built before the index existed and runs interrupted before
+    the index was saved. Returns True if the index changed.
+    """
+    ids = set(ids)
+    extra = [doc_id for doc_id in index.documents if doc_id not in ids]
+    missing = [doc_id for doc_id in ids if doc_id not in index]
+    index.delete(extra)
+    for start in range(0, len(missing), batch_size):
+        documents = vectorstore.get_by_ids(missing[start:start + batch_size])
+        index.add([document.id for document in documents], [document.page_content for document in documents])
+    return bool(extra or missing)
+
+def reciprocal_rank_fusion(*rankings: List[str], k: int = 60) -> List[str]:
+    """Ids ordered by the sum of 1 / (k + rank) over the rankings they appear in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and vector search fused with reciprocal-rank fusion
+
+    Each side fetches fetch_k candidates, the k best fused ones are returned.
+    Identifier queries skip the embedder when BM25 finds something.
+    """
+
+    vectorstore: Any
+    index: Any
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
+
+    def _documents(self, ids: List[str], known: Dict[str, Document]) -> List[Document]:
+        missing = [doc_id for doc_id in ids if doc_id not in known]
+        if missing:
+            known = {**known, **{document.id: document for document in self.vectorstore.get_by_ids(missing)}}
+        return [known[doc_id] for doc_id in ids if doc_id in known]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if is_identifier_query(query):
+            lexical = [doc_id for doc_id, _ in self.index.search(query, self.k)]
+            if lexical:
+                # Fast path, no embedding call
+                return self._documents(lexical, {})
+
+        vector_documents = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        known = {document.id: document for document in vector_documents if document.id}
+        lexical = [doc_id for doc_id, _ in self.index.search(query, self.fetch_k)]
+
+        fused = reciprocal_rank_fusion(list(known), lexical, k=self.rrf_k)
+        return self._documents(fused[:self.k], known)
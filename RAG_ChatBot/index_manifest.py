@@ -0,0 +1,100 @@
+"""Indexing manifest for createVectorDB
+
+Remembers, for every indexed PDF, the hash of its content, the splitter settings
+and the ids of its chunks in the vector store, so that only new or changed files
+are embedded again and chunks of removed files can be deleted
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """sha256 of a file content, read by blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def settings_key(**settings) -> str:
+    """Short stable key of the splitter settings, chunks change when they do"""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+@dataclass
+class ManifestEntry:
+    """One indexed file"""
+
+    content_hash: str
+    settings: str
+    chunk_ids: List[str]
+    # Size and mtime at indexing time, to skip hashing files that weren't touched
+    size: int = 0
+    mtime: float = 0.0
+
+@dataclass
+class IndexChanges:
+    """Files to embed or delete to bring the vector store up to date"""
+
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+class IndexManifest:
+    """JSON manifest of the indexed files, stored next to the vector store"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.exists = os.path.exists(path)
+
+        if self.exists:
+            with open(path, encoding="utf-8") as f:
+                self.entries = {name: ManifestEntry(**entry) for name, entry in json.load(f).items()}
+
+    def content_hash(self, name: str, path: str) -> str:
+        """Hash of a file, reused from the manifest if its size and mtime didn't change"""
+        stat = os.stat(path)
+        entry = self.entries.get(name)
+        if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return entry.content_hash
+        return file_hash(path)
+
+    def diff(self, files: Dict[str, str], settings: str) -> IndexChanges:
+        """Compare the files on disk (name -> content hash) with the manifest"""
+        changes = IndexChanges()
+        for name, content_hash in files.items():
+            entry = self.entries.get(name)
+            if entry is None:
+                changes.added.append(name)
+            elif entry.content_hash != content_hash or entry.settings != settings:
+                changes.changed.append(name)
+            else:
+                changes.unchanged.append(name)
+
+        changes.removed = [name for name in self.entries if name not in files]
+        return changes
+
+    @staticmethod
+    def chunk_ids(name: str, content_hash: str, settings: str, count: int) -> List[str]:
+        """Deterministic chunk ids, so re-adding a file after a crash overwrites instead of duplicating"""
+        prefix = hashlib.sha1(f"{name}\0{content_hash}\0{settings}".encode()).hexdigest()[:16]
+        return [f"{prefix}-{i}" for i in range(count)]
+
+    def set(self, name: str, path: str, content_hash: str, settings: str, chunk_ids: List[str]) -> None:
+        stat = os.stat(path)
+        self.entries[name] = ManifestEntry(content_hash, settings, chunk_ids, stat.st_size, stat.st_mtime)
+
+    def remove(self, name: str) -> None:
+        self.entries.pop(name, None)
+
+    def save(self) -> None:
+        """Write the manifest atomically, an interrupted write never leaves it half done"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({name: asdict(entry) for name, entry in self.entries.items()}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
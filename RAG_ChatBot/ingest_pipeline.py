@@ -0,0 +1,173 @@
+"""Streaming PDF ingestion for createVectorDB
+
+PDFs are loaded and split in a process pool, chunks go through a bounded queue
+in batches, and several writer threads embed and add the batches to the vector
+store concurrently. Memory is bounded by the files in flight and the queue, not
+by the size of the corpus.
+"""
+
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class IngestConfig:
+    """Ingestion settings"""
+
+    chunk_size: int = 1000
+    chunk_overlap: int = 200
+    # Processes loading and splitting PDFs
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    # Chunks per embedding request
+    batch_size: int = 64
+    # Embedding requests in flight at once
+    max_concurrent_requests: int = 4
+    # Batches waiting for a writer, parsing pauses when it is full
+    queue_size: int = 8
+
+# One splitter per worker process, reused for every file it handles
+_splitters: Dict[Tuple[int, int], RecursiveCharacterTextSplitter] = {}
+
+def load_and_split(path: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """Load one PDF and split it in chunks, runs in a worker process"""
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
+    return _splitters[key].split_documents(PyPDFLoader(path).load())
+
+@dataclass
+class IngestReport:
+    """Outcome of ingest_pdfs"""
+
+    chunks: int = 0
+    # Files left out, with the error that stopped them
+    failed: Dict[str, str] = field(default_factory=dict)
+
+def ingest_pdfs(
+    vectorstore,
+    files: List[Tuple[str, str]],
+    chunk_ids: Callable[[str, int], List[str]],
+    on_file_done: Callable[[str, str, List[str]], None] | None = None,
+    config: IngestConfig | None = None,
+    on_batch_done: Callable[[List[Document], List[str]], None] | None = None,
+) -> IngestReport:
+    """Add the chunks of (name, path) PDFs to the vector store
+
+    chunk_ids gives the ids of a file's chunks from its name and chunk count.
+    on_file_done is called once all chunks of a file are written, one call at a time.
+    on_batch_done is called with each batch written, one call at a time.
+    A file that can't be loaded or whose batches failed is logged, not reported
+    to on_file_done and listed in the returned report, the other files go on.
+    """
+    config = config or IngestConfig()
+    report = IngestReport()
+    if not files:
+        return report
+
+    batches: "queue.Queue[Tuple[str, List[Document], List[str]] | None]" = queue.Queue(config.queue_size)
+    pending: Dict[str, int] = {}
+    paths = dict(files)
+    ids_by_file: Dict[str, List[str]] = {}
+    lock = threading.Lock()
+
+    def fail(name: str, error: Exception) -> None:
+        # Called with lock held, the first error of a file is kept
+        if name not in report.failed:
+            logger.warning("Skipping %s: %s: %s", name, type(error).__name__, error)
+            report.failed[name] = f"{type(error).__name__}: {error}"
+
+    def file_done(name: str) -> None:
+        # Called with lock held
+        if on_file_done is not None and name not in report.failed:
+            on_file_done(name, paths[name], ids_by_file[name])
+        ids_by_file.pop(name, None)
+
+    def write_batches() -> None:
+        while (batch := batches.get()) is not None:
+            name, documents, ids = batch
+            try:
+                # One embedding request for the batch, then one write
+                vectorstore.add_documents(documents, ids=ids)
+                if on_batch_done is not None:
+                    with lock:
+                        on_batch_done(documents, ids)
+            except Exception as e:
+                with lock:
+                    fail(name, e)
+            with lock:
+                pending[name] -= 1
+                if pending[name] == 0:
+                    del pending[name]
+                    file_done(name)
+
+    writers = [
+        threading.Thread(target=write_batches, daemon=True, name=f"ingest-writer-{i}")
+        for i in range(config.max_concurrent_requests)
+    ]
+
+    jobs = list(files)
+    # A few files ahead of the writers, not the whole folder
+    max_in_flight = max(1, config.workers) * 2
+    in_flight = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(config.workers, len(files)))) as pool:
+            def submit() -> None:
+                while jobs and len(in_flight) < max_in_flight:
+                    name, path = jobs.pop(0)
+                    in_flight[pool.submit(load_and_split, path, config.chunk_size, config.chunk_overlap)] = name
+
+            # The worker processes are forked by the first submissions, start the
+            # writer threads only after that so no thread is copied into a fork
+            submit()
+            for writer in writers:
+                writer.start()
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        documents = future.result()
+                    except Exception as e:
+                        with lock:
+                            fail(name, e)
+                        continue
+
+                    ids = chunk_ids(name, len(documents))
+                    report.chunks += len(documents)
+                    with lock:
+                        ids_by_file[name] = ids
+                        if not documents:
+                            file_done(name)
+                            continue
+                        pending[name] = (len(documents) + config.batch_size - 1) // config.batch_size
+
+                    for start in range(0, len(documents), config.batch_size):
+                        # Blocks while the writers are behind
+                        batches.put((
+                            name,
+                            documents[start:start + config.batch_size],
+                            ids[start:start + config.batch_size],
+                        ))
+                submit()
+    finally:
+        started = [writer for writer in writers if writer.is_alive()]
+        for _ in started:
+            batches.put(None)
+        for writer in started:
+            writer.join()
+
+    return report
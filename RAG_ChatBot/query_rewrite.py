@@ -0,0 +1,85 @@
+"""Retrieval with question reformulation only when it is needed
+
+create_history_aware_retriever asks the LLM to rewrite every question that
+comes with a chat history before retrieving, which delays the first token of
+the answer by a whole generation. Here the raw question is used when there is
+no history or when it reads as standalone, and the LLM rewrite is kept for
+follow-ups that refer back to the conversation.
+"""
+
+import re
+from typing import Any, Dict, List
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel
+
+# Words pointing back to something said earlier
+REFERENCE_WORDS = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "she", "him", "her", "his", "hers", "one", "ones", "former", "latter",
+    "above", "previous", "same", "there", "such",
+}
+# Openings of follow-up questions ("and for ethanol?", "what about the yield?")
+FOLLOW_UP_STARTS = (
+    "and", "also", "what about", "how about", "why", "so", "then", "but", "or",
+    "more", "else", "again", "same", "continue", "explain further",
+)
+
+def needs_reformulation(question: str, chat_history: List[Any] | None = None) -> bool:
+    """Cheap local check whether a question depends on the chat history"""
+    if not chat_history:
+        return False
+
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    if len(words) <= 2:
+        # "why?", "and ethanol?", too short to stand alone
+        return True
+    if any(words[:len(start.split())] == start.split() for start in FOLLOW_UP_STARTS):
+        return True
+    return any(word in REFERENCE_WORDS for word in words)
+
+def merge_documents(*results: List[Document], limit: int | None = None) -> List[Document]:
+    """Interleave ranked document lists, dropping duplicates"""
+    merged = []
+    seen = set()
+    for rank in range(max((len(documents) for documents in results), default=0)):
+        for documents in results:
+            if rank >= len(documents):
+                continue
+            document = documents[rank]
+            key = document.id or document.page_content
+            if key not in seen:
+                seen.add(key)
+                merged.append(document)
+    return merged[:limit] if limit else merged
+
+def build_context_retriever(llm, retriever, contextualize_prompt, concurrent: bool = False) -> Runnable:
+    """Runnable from {"input", "chat_history"} to documents, for create_retrieval_chain
+
+    With concurrent, a question that needs reformulation is also retrieved as
+    is while the LLM rewrites it, and both results are merged, so a rewrite
+    that drifts doesn't lose the hits of the original wording.
+    """
+    reformulate = contextualize_prompt | llm | StrOutputParser()
+    reformulated_retriever = reformulate | retriever
+    both = RunnableParallel(
+        reformulated=reformulated_retriever,
+        raw=RunnableLambda(lambda inputs: inputs["input"]) | retriever,
+    )
+
+    def retrieve(inputs: Dict[str, Any]) -> List[Document]:
+        if not needs_reformulation(inputs["input"], inputs.get("chat_history")):
+            # Fast path, no generation before retrieval
+            return retriever.invoke(inputs["input"])
+
+        if not concurrent:
+            return reformulated_retriever.invoke(inputs)
+
+        results = both.invoke(inputs)
+        return merge_documents(
+            results["reformulated"], results["raw"],
+            limit=max(len(results["reformulated"]), len(results["raw"])),
+        )
+
+    return RunnableLambda(retrieve).with_config(run_name="context_retriever")
@@ -0,0 +1,394 @@
+"""In-process memory-mapped vector index, an alternative to Chroma
+
+Normalized embeddings are kept in a float16 matrix on disk, read through
+np.memmap, with the ids, texts and metadata in an append-only JSONL sidecar.
+A query is one matrix product over the matrix, or, in IVF mode, over the rows
+of the few clusters closest to the query. MmapVectorStore implements the
+LangChain VectorStore interface, so as_retriever(search_kwargs={"k":3})
+works as with Chroma.
+"""
+
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+class MmapVectorIndex:
+    """Append-only float16 matrix with tombstone deletes
+
+    vectors.bin holds one normalized row per chunk, rows.jsonl one line per
+    added row ({"id", "text", "metadata"}) or per deletion ({"delete": id}).
+    Deleted rows are skipped by queries and dropped when the files are
+    compacted, once they are a quarter of the matrix. Compaction writes both
+    files under the next generation number and switches to them by rewriting
+    meta.json, so a crash never pairs new vectors with old rows.
+    """
+
+    # Rows scored per block, so a float32 copy of the whole matrix is never made
+    BLOCK_ROWS = 16384
+
+    def __init__(self, directory: str, ivf_lists: int = 0, ivf_probe: int = 8, ivf_min_rows: int = 50000):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.generation = 0
+        self.vectors_path, self.rows_path = self._paths(0)
+        self.ivf_path = os.path.join(directory, "ivf.npz")
+        # IVF mode: number of clusters, 0 for exact search only
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        # Exact search is fast enough below this many rows
+        self.ivf_min_rows = ivf_min_rows
+
+        self._lock = threading.RLock()
+        self._reset()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _reset(self) -> None:
+        self.dim: int | None = None
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        # Live rows only, id -> row
+        self.rows: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.centroids: np.ndarray | None = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._vectors: np.memmap | None = None
+
+    @property
+    def count(self) -> int:
+        """Live rows"""
+        return len(self.rows)
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        """Vectors and rows files of a generation, generation 0 keeps the plain names"""
+        suffix = f".{generation}" if generation else ""
+        return (
+            os.path.join(self.directory, f"vectors{suffix}.bin"),
+            os.path.join(self.directory, f"rows{suffix}.jsonl"),
+        )
+
+    def _save_meta(self) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "generation": self.generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def _remove_stale_files(self) -> None:
+        # Files of other generations and temporary files left by an interrupted compaction
+        current = {os.path.basename(self.vectors_path), os.path.basename(self.rows_path)}
+        for name in os.listdir(self.directory):
+            if name in current or not (name.startswith("vectors") or name.startswith("rows")):
+                continue
+            if name.endswith((".bin", ".jsonl", ".tmp")):
+                os.remove(os.path.join(self.directory, name))
+
+    def _load(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.generation = meta.get("generation", 0)
+        self.vectors_path, self.rows_path = self._paths(self.generation)
+        self._remove_stale_files()
+
+        # Raw lines with the row they add, None for deletions
+        lines: List[Tuple[bytes, int | None]] = []
+        valid_bytes = 0
+        with open(self.rows_path, "ab+") as f:
+            f.seek(0)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of an interrupted write
+                    break
+                valid_bytes += len(line)
+                if "delete" in entry:
+                    self.rows.pop(entry["delete"], None)
+                    lines.append((line, None))
+                    continue
+                lines.append((line, len(self.ids)))
+                self.rows[entry["id"]] = len(self.ids)
+                self.ids.append(entry["id"])
+                self.texts.append(entry["text"])
+                self.metadatas.append(entry["metadata"])
+            f.truncate(valid_bytes)
+
+        # A process stopped between the two writes leaves rows on one side only
+        row_size = self.dim * np.dtype(np.float16).itemsize
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        row_count = min(len(self.ids), vectors_size // row_size)
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(row_count * row_size)
+
+        if row_count < len(self.ids):
+            # Rows without a vector are dropped from the file too, otherwise the
+            # next added vectors would be paired with them on the next load
+            tmp_rows = f"{self.rows_path}.tmp"
+            with open(tmp_rows, "wb") as f:
+                f.writelines(line for line, row in lines if row is None or row < row_count)
+            os.replace(tmp_rows, self.rows_path)
+
+        del self.ids[row_count:], self.texts[row_count:], self.metadatas[row_count:]
+        self.rows = {row_id: row for row_id, row in self.rows.items() if row < row_count}
+        self.alive = np.zeros(row_count, dtype=bool)
+        self.alive[list(self.rows.values())] = True
+
+        if os.path.exists(self.ivf_path):
+            with np.load(self.ivf_path) as ivf:
+                if len(ivf["assignments"]) == row_count:
+                    self.centroids, self.assignments = ivf["centroids"], ivf["assignments"]
+
+    def _matrix(self) -> np.ndarray:
+        rows = len(self.ids)
+        if self._vectors is None or self._vectors.shape[0] != rows:
+            if rows == 0:
+                return np.zeros((0, self.dim or 0), dtype=np.float16)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+        return self._vectors
+
+    def add(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Append rows, an existing id is replaced"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._save_meta()
+            self.delete([row_id for row_id in ids if row_id in self.rows])
+
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            with open(self.rows_path, "a", encoding="utf-8") as f:
+                for row_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": row_id, "text": text, "metadata": metadata}) + "\n")
+
+            start = len(self.ids)
+            for offset, row_id in enumerate(ids):
+                self.rows[row_id] = start + offset
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+
+            if self.centroids is not None:
+                # New rows join their closest cluster, clusters are rebuilt by build_ivf
+                self.assignments = np.concatenate([self.assignments, np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)])
+                self._save_ivf()
+            elif self.ivf_lists and self.count >= self.ivf_min_rows:
+                self.build_ivf()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Mark rows deleted, return how many existed"""
+        with self._lock:
+            rows = [self.rows.pop(row_id) for row_id in ids if row_id in self.rows]
+            if not rows:
+                return 0
+            self.alive[rows] = False
+            with open(self.rows_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({"delete": self.ids[row]}) + "\n")
+
+            dead = len(self.ids) - self.count
+            if dead > max(1024, len(self.ids) // 4):
+                self.compact()
+            return len(rows)
+
+    def compact(self) -> None:
+        """Rewrite the files without the deleted rows"""
+        with self._lock:
+            keep = np.flatnonzero(self.alive)
+            matrix = np.asarray(self._matrix()[keep])
+            self._vectors = None
+
+            # Both files are complete on disk before meta.json points to them
+            vectors_path, rows_path = self._paths(self.generation + 1)
+            with open(vectors_path, "wb") as f:
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(rows_path, "w", encoding="utf-8") as f:
+                for row in keep:
+                    f.write(json.dumps({"id": self.ids[row], "text": self.texts[row], "metadata": self.metadatas[row]}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.generation += 1
+            self._save_meta()
+            self.vectors_path, self.rows_path = vectors_path, rows_path
+            self._remove_stale_files()
+
+            self.ids = [self.ids[row] for row in keep]
+            self.texts = [self.texts[row] for row in keep]
+            self.metadatas = [self.metadatas[row] for row in keep]
+            self.rows = {row_id: row for row, row_id in enumerate(self.ids)}
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            if self.centroids is not None:
+                self.assignments = self.assignments[keep]
+                self._save_ivf()
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in (self.vectors_path, self.rows_path, self.meta_path, self.ivf_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._reset()
+            self.generation = 0
+            self.vectors_path, self.rows_path = self._paths(0)
+
+    def build_ivf(self, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the live rows with spherical k-means for IVF search"""
+        with self._lock:
+            live = np.flatnonzero(self.alive)
+            lists = min(self.ivf_lists, len(live))
+            if lists == 0:
+                return
+            matrix = self._matrix()
+            rng = np.random.default_rng(seed)
+            sample = np.asarray(matrix[np.sort(rng.choice(live, min(len(live), lists * 256), replace=False))], dtype=np.float32)
+
+            centroids = sample[rng.choice(len(sample), lists, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for cluster in range(lists):
+                    members = sample[labels == cluster]
+                    if len(members):
+                        centroids[cluster] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            assignments = np.empty(len(self.ids), dtype=np.int32)
+            for start in range(0, len(self.ids), self.BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+                assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+            self.centroids, self.assignments = centroids, assignments
+            self._save_ivf()
+
+    def _save_ivf(self) -> None:
+        with open(self.ivf_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments)
+
+    def search(self, vector: List[float], k: int) -> List[Tuple[Document, float]]:
+        """Documents of the k closest live rows with their cosine similarity"""
+        # Snapshot under the lock, score without it so queries don't wait on each other
+        with self._lock:
+            if not self.rows:
+                return []
+            matrix, alive = self._matrix(), self.alive
+            ids, texts, metadatas = self.ids, self.texts, self.metadatas
+            centroids, assignments = self.centroids, self.assignments
+
+        query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+        if centroids is not None:
+            # Only the rows of the closest clusters are scored
+            probe = np.argsort(centroids @ query)[-self.ivf_probe:]
+            candidates = np.flatnonzero(np.isin(assignments, probe) & alive)
+            scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+        else:
+            candidates = np.flatnonzero(alive)
+            scores = np.empty(len(alive), dtype=np.float32)
+            for start in range(0, len(alive), self.BLOCK_ROWS):
+                block = np.asarray(matrix[start:start + self.BLOCK_ROWS], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query
+            scores = scores[candidates]
+
+        if len(candidates) == 0:
+            return []
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(id=ids[row], page_content=texts[row], metadata=metadatas[row]), float(score))
+            for row, score in zip(candidates[top], scores[top])
+        ]
+
+class MmapVectorStore(VectorStore):
+    """LangChain vector store backed by MmapVectorIndex"""
+
+    def __init__(self, embedding_function: Embeddings, persist_directory: str, **index_kwargs):
+        self.embedding_function = embedding_function
+        self.index = MmapVectorIndex(persist_directory, **index_kwargs)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: List[dict] | None = None,
+        ids: List[str] | None = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        # Embedded outside the index lock, so concurrent writers overlap on the model
+        vectors = self.embedding_function.embed_documents(texts)
+        self.index.add(ids, np.asarray(vectors), texts, list(metadatas))
+        return ids
+
+    def delete(self, ids: List[str] | None = None, **kwargs: Any) -> bool | None:
+        if ids is None:
+            return None
+        self.index.delete(ids)
+        return True
+
+    def reset_collection(self) -> None:
+        """Drop every row, same name as Chroma"""
+        self.index.clear()
+
+    def get_by_ids(self, ids: List[str], /) -> List[Document]:
+        index = self.index
+        with index._lock:
+            return [
+                Document(id=row_id, page_content=index.texts[index.rows[row_id]], metadata=index.metadatas[index.rows[row_id]])
+                for row_id in ids if row_id in index.rows
+            ]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return self.index.search(embedding, k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity in [-1, 1] to a relevance in [0, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: List[dict] | None = None,
+        ids: List[str] | None = None,
+        persist_directory: str = "mmap_index",
+        **kwargs: Any,
+    ) -> "MmapVectorStore":
+        store = cls(embedding, persist_directory, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
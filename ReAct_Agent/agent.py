@@ -2,16 +2,18 @@
 
 from typing import Any, Dict, List
 from loguru import logger
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dataclasses import dataclass
 
 from utils.history_util import MessageHistory
 from utils.tool_util import execute_tools
+from utils.parser_util import ReActStreamParser, STOP_SEQUENCES, parse_actions, format_observation
+from utils.answer_cache import AnswerCache
+from utils.tokenizer_util import warm_tokenizer
 from tools import Tool, FakeGetWeather
 
 import asyncio
 import os
-import re
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,7 +29,8 @@ class ModelConfig:
     model: str = "gpt-4o"
     max_tokens: int = 2048
     temperature: float = 0.7
-    context_window_size: int = 10
+    # Context window of the model in tokens, the prompt is kept within it minus max_tokens
+    context_window_size: int = 128000
 
 class ReActAgent:
     """ReAct Agent instance"""
@@ -38,24 +41,27 @@ class ReActAgent:
         system: str | None = None,
         tools: List[Tool] | None = None,
         config: ModelConfig | None = None,
-        client: OpenAI | None = None,
+        client: AsyncOpenAI | None = None,
         history: MessageHistory | None = None,
         message_param: Dict[str, Any] | None = None,
+        answer_cache: AnswerCache | None = None,
     ):
         self.name = name
         self.system = system
         self.tools = tools
         self.config = config or ModelConfig()
-        self.client = client or OpenAI(
+        self.client = client or AsyncOpenAI(
             base_url=base_url,
             api_key=api_key,
         )
-        self.history = history or MessageHistory(
-            model=self.config.model,
-            system=self.system,
-            context_window_size=self.config.context_window_size,
-        )
         self.message_param = message_param or {}
+        # Opt-in, answers are cached by question only, without the conversation
+        self.answer_cache = answer_cache
+        # Messages added by the last run, stored with its cached answer
+        self.trajectory: List[Dict[str, Any]] = []
+
+        if not self.tools:
+            self.tools = [FakeGetWeather()]
 
         if not self.system:
             self.system = f"""
@@ -65,6 +71,7 @@ class ReActAgent:
             At the end of the loop, you return an Answer.
             Use Thought to describe your thought about the question you have been asked.
             Use Action to run one of the actions available to you.
+            When several actions don't depend on each other, write one Action line for each in the same step.
             Observation will be the result of running those actions.
 
             Your available actions are:
@@ -78,8 +85,12 @@ class ReActAgent:
             Answer: The weather in Tokyo is sunny.
             """.strip()
 
-        if not self.tools:
-            self.tools = [FakeGetWeather()]
+        # History needs the final system prompt, so it is created last
+        self.history = history or MessageHistory(
+            model=self.config.model,
+            system=self.system,
+            context_window_size=self.config.context_window_size - self.config.max_tokens,
+        )
 
         if not self.history.model:
             self.history.model = self.config.model
@@ -94,39 +105,74 @@ class ReActAgent:
             "messages": self.history.format_for_api(),
             **self.message_param,
         }
+
+    async def _record(self, role: str, content: str, usage: Any = None) -> None:
+        """Add a message to the history and to the trajectory of the current run"""
+        await self.history.add_message(role, content, usage)
+        self.trajectory.append({"role": role, "content": content})
     
     async def _agent_loop(self, user_input: str) ->str:
         """Main agent loop"""
 
         user_input = "Question: " + user_input.strip()
         logger.info(f"[{self.name}] Received: {user_input.strip()}")
-        await self.history.add_message("user", user_input.strip(), None)
+        self.trajectory = []
+        await self._record("user", user_input.strip(), None)
 
         tool_dict = {tool.name: tool for tool in self.tools}
         
         while True:
-            self.history.truncate()
+            await self.history.truncate()
             params = self._prepare_message_params()
 
-            response = await self.client.chat.completions.create(**params)
-            content = response.choices[0].message.content
-            usage = response.usage
-
-            if "Action: " in content:
+            # Stop before a hallucinated Observation, and dispatch the tool
+            # as soon as the Action line is complete instead of at the last token
+            stream = await self.client.chat.completions.create(
+                **params,
+                stop=STOP_SEQUENCES,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            parser = ReActStreamParser()
+            # One task per Action line, started as soon as the line is complete,
+            # so independent actions of a step run concurrently
+            tool_tasks: List[asyncio.Task] = []
+            usage = None
+
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+
+                    for action in parser.feed(chunk.choices[0].delta.content):
+                        tool_tasks.append(asyncio.create_task(execute_tools([action], tool_dict)))
+
+                for action in parser.finish():
+                    tool_tasks.append(asyncio.create_task(execute_tools([action], tool_dict)))
+            except BaseException:
+                for task in tool_tasks:
+                    task.cancel()
+                raise
+
+            content = parser.text
+
+            if tool_tasks:
                 logger.info(f"[{self.name}] Action: {content}")
-                tool_call = self.parse_response(content)
+                await self._record("assistant", content, usage)
 
-                await self.history.add_message("assistant", content, usage)
+                results = [result for results in await asyncio.gather(*tool_tasks) for result in results]
+                observation = format_observation(parser.actions, results)
+                logger.info(f"[{self.name}] {observation}")
 
-                observation = await execute_tools([tool_call], tool_dict)
-                logger.info(f"[{self.name}] Observation: {observation}")
-
-                await self.history.add_message("user", observation, None)
+                await self._record("user", observation, None)
             
-            elif "Answer: " in content:
+            elif (answer := parser.answer()) is not None:
                 logger.info(f"[{self.name}] Answer: {content}")
-                await self.history.add_message("assistant", content, usage)
-                return content.split("Answer: ")[1].strip()
+                await self._record("assistant", content, usage)
+                return answer
             
             else:
                 logger.warning(f"[{self.name}] Unknown response: {content}")
@@ -137,23 +183,40 @@ class ReActAgent:
                     )
                 )
 
-    def parse_response(self, response: str) -> Dict[str, str]:
-        if not (action_function_match:= re.search(r"(?<=Action: )[\w_]*", response)):
+    def parse_response(self, response: str) -> List[Dict[str, Any]]:
+        """Tool calls of every Action line in a complete response, each with its own arguments"""
+        if not (actions := parse_actions(response)):
             raise ValueError("No action function found in response")
         
-        function_name = action_function_match.group(0)
-        pattern = r'(\w+)="([^"]*)"'
-        matches = re.findall(pattern, response)
-        action_args = dict(matches)
-        return {
-            "name": function_name,
-            "args": action_args,
-        }
+        return actions
     
 
+    def _cache_answer(self, user_input: str, answer: str) -> None:
+        """Cache the answer of the last run for as long as its least durable tool allows"""
+        tool_dict = {tool.name: tool for tool in self.tools}
+        used_tools = sorted({
+            action["name"]
+            for message in self.trajectory if message["role"] == "assistant"
+            for action in parse_actions(message["content"])
+        })
+        ttl = min((tool_dict[name].cache_ttl for name in used_tools if name in tool_dict), default=None)
+        self.answer_cache.set(user_input, answer, list(self.trajectory), used_tools, ttl)
+
     async def run_async(self, user_input: str) -> str:
         """Should extend with MCP bur simplfied for now"""
-        return await self._agent_loop(user_input)
+        # Load the encoding in a thread, never on the first add_message of the turn
+        await warm_tokenizer(self.history.model)
+        if self.answer_cache is not None and (cached := self.answer_cache.get(user_input)) is not None:
+            logger.info(f"[{self.name}] Answer from cache: {cached.answer}")
+            # The conversation keeps the question and answer, the tool calls are not replayed
+            await self.history.add_message("user", "Question: " + user_input.strip(), None)
+            await self.history.add_message("assistant", f"Answer: {cached.answer}", None)
+            return cached.answer
+
+        answer = await self._agent_loop(user_input)
+        if self.answer_cache is not None:
+            self._cache_answer(user_input, answer)
+        return answer
 
     def run(self, user_input: str) -> str:
         """Run the agent asynchronously"""
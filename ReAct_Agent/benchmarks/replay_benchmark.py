@@ -0,0 +1,346 @@
+"""Deterministic replay benchmark for the ReAct loop
+
+Drives ReActAgent with a scripted client that replays recorded Thought/Action/Answer
+transcripts, and reports the framework overhead of each step (parsing, history
+formatting, truncation, tool dispatch) separately from the simulated model latency,
+across history lengths and tool counts. Nothing goes over the network, so the
+numbers only move when the loop, history or tool code changes.
+
+Transcript format (JSON), one list of assistant responses per question:
+{
+    "transcripts": [
+        ["Thought: ...\\nAction: get_weather(city=\\"Tokyo\\")\\n", "Thought: ...\\nAnswer: ..."]
+    ]
+}
+
+Usage (from ReAct_Agent):
+    python -m benchmarks.replay_benchmark
+    python -m benchmarks.replay_benchmark --history-lengths 0,50,200 --tool-counts 1,20 --output report.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import agent as agent_module
+from agent import ReActAgent, ModelConfig
+from tools import Tool, FakeGetWeather
+from utils.parser_util import ReActStreamParser
+
+from loguru import logger
+
+DEFAULT_TRANSCRIPTS: List[List[str]] = [
+    [
+        'Thought: I need to use the get weather tool to get the weather in Tokyo.\nAction: get_weather(city="Tokyo")\n',
+        "Thought: I have the weather in Tokyo.\nAnswer: The weather in Tokyo is sunny.",
+    ],
+    [
+        "Thought: Both cities are independent, I can look them up in one step.\n"
+        'Action: get_weather(city="Paris")\nAction: get_weather(city="Berlin")\n',
+        "Thought: I have both.\nAnswer: It is sunny in Paris and in Berlin.",
+    ],
+    [
+        "Thought: I already know this one.\nAnswer: Tokyo is the capital of Japan.",
+    ],
+]
+
+class EchoTool(Tool):
+    """Instant tool, so dispatch time is only framework overhead"""
+
+    def __init__(self, index: int):
+        super().__init__(
+            name=f"tool_{index}",
+            description=f"Benchmark tool number {index}, returns its arguments",
+            input_schema={
+                "type": "object",
+                "properties": {"value": {"type": "string", "description": "Any value"}},
+                "required": [],
+            },
+        )
+
+    async def execute(self, **kwargs) -> str:
+        return json.dumps(kwargs)
+
+class ScriptedStream:
+    """Async iterator of chat completion chunks, sleeping like a model would"""
+
+    def __init__(self, client: "ScriptedClient", text: str, prompt_tokens: int):
+        self.client = client
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await self.client.sleep(self.client.latency)
+        for start in range(0, len(self.text), self.client.chunk_size):
+            await self.client.sleep(self.client.chunk_delay)
+            delta = SimpleNamespace(content=self.text[start:start + self.client.chunk_size])
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+        usage = SimpleNamespace(prompt_tokens=self.prompt_tokens, completion_tokens=len(self.text) // 4)
+        yield SimpleNamespace(usage=usage, choices=[])
+
+class ScriptedClient:
+    """Stand-in for AsyncOpenAI replaying transcripts in order
+
+    Each question replays the next transcript, one response per model call.
+    Stop sequences are applied like the API does, so a recorded Observation
+    line is never returned.
+    """
+
+    def __init__(
+        self,
+        transcripts: List[List[str]],
+        latency: float = 0.02,
+        chunk_delay: float = 0.0,
+        chunk_size: int = 8,
+    ):
+        self.transcripts = transcripts
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.transcript_index = -1
+        self.step_index = 0
+        self.requests = 0
+        # Content every request must hold, and how many requests lacked it
+        self.expected: str | None = None
+        self.missing = 0
+        # Wall time spent in simulated model latency, event loop wake-up included
+        self.model_time = 0.0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def next_question(self) -> None:
+        self.transcript_index = (self.transcript_index + 1) % len(self.transcripts)
+        self.step_index = 0
+
+    async def sleep(self, seconds: float) -> None:
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        self.model_time += time.perf_counter() - started
+
+    async def create(self, messages: List[Dict[str, Any]], stop: List[str] | None = None, **kwargs) -> ScriptedStream:
+        transcript = self.transcripts[self.transcript_index]
+        text = transcript[min(self.step_index, len(transcript) - 1)]
+        self.step_index += 1
+        self.requests += 1
+        if self.expected is not None and not any(message["content"] == self.expected for message in messages):
+            self.missing += 1
+
+        for sequence in stop or []:
+            text = text.split(sequence, 1)[0]
+
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        return ScriptedStream(self, text, prompt_tokens)
+
+class PhaseTimer:
+    """Accumulate the time spent in each instrumented phase"""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = defaultdict(float)
+
+    def sync(self, phase: str, function):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.totals[phase] += time.perf_counter() - started
+        return wrapper
+
+    def coroutine(self, phase: str, function):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.totals[phase] += time.perf_counter() - started
+        return wrapper
+
+def instrument(timer: PhaseTimer) -> None:
+    """Time parsing and tool dispatch inside agent._agent_loop"""
+
+    class TimedParser(ReActStreamParser):
+        feed = timer.sync("parse", ReActStreamParser.feed)
+        finish = timer.sync("parse", ReActStreamParser.finish)
+
+    agent_module.ReActStreamParser = TimedParser
+    agent_module.execute_tools = timer.coroutine("dispatch", agent_module.execute_tools)
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+async def build_agent(client: ScriptedClient, history_length: int, tool_count: int, context_window: int) -> ReActAgent:
+    tools: List[Tool] = [FakeGetWeather()] + [EchoTool(i) for i in range(tool_count - 1)]
+    agent = ReActAgent(
+        "ReAct Benchmark",
+        tools=tools,
+        config=ModelConfig(model="gpt-4o", context_window_size=context_window),
+        client=client,
+    )
+
+    # Earlier turns, so formatting and truncation work on a realistic history
+    for turn in range(history_length):
+        await agent.history.add_message("user", f"Question: earlier question number {turn} about the weather", None)
+        usage = SimpleNamespace(prompt_tokens=agent.history.total_tokens + 20, completion_tokens=15)
+        await agent.history.add_message("assistant", f"Thought: I know it.\nAnswer: earlier answer number {turn}.", usage)
+    return agent
+
+async def run_config(
+    args: argparse.Namespace,
+    timer: PhaseTimer,
+    transcripts: List[List[str]],
+    history_length: int,
+    tool_count: int,
+) -> Dict[str, Any]:
+    client = ScriptedClient(transcripts, latency=args.latency, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size)
+    agent = await build_agent(client, history_length, tool_count, args.context_window)
+
+    agent.history.format_for_api = timer.sync("format", agent.history.format_for_api)
+    agent.history.truncate = timer.coroutine("truncate", agent.history.truncate)
+
+    # Every run starts from the same history
+    snapshot = (
+        list(agent.history.messages), list(agent.history.message_tokens),
+        agent.history.total_tokens, agent.history.truncated,
+    )
+
+    step_overheads: List[float] = []
+    phases: Dict[str, float] = defaultdict(float)
+    steps = 0
+    model_time = 0.0
+    wall_time = 0.0
+    truncated_runs = 0
+
+    for run in range(args.warmup + args.runs):
+        (
+            agent.history.messages, agent.history.message_tokens,
+            agent.history.total_tokens, agent.history.truncated,
+        ) = (list(snapshot[0]), list(snapshot[1]), snapshot[2], snapshot[3])
+        client.next_question()
+        question = f"Benchmark question {run}"
+        client.expected = f"Question: {question}"
+        timer.totals.clear()
+        client.model_time = 0.0
+        requests = client.requests
+
+        started = time.perf_counter()
+        await agent.run_async(question)
+        elapsed = time.perf_counter() - started
+
+        # Timings only count for an agent that still sees what it is answering
+        if client.missing:
+            raise RuntimeError(
+                f"history={history_length} tools={tool_count}: "
+                f"{client.missing} requests lost the question {question!r}"
+            )
+
+        if run < args.warmup:
+            continue
+
+        truncated_runs += agent.history.truncated and not snapshot[3]
+        run_steps = client.requests - requests
+        steps += run_steps
+        model_time += client.model_time
+        wall_time += elapsed
+        step_overheads.append((elapsed - client.model_time) / run_steps)
+        for phase, seconds in timer.totals.items():
+            phases[phase] += seconds
+
+    overhead = wall_time - model_time
+    measured = sum(phases.values())
+    return {
+        "history_length": history_length,
+        "tool_count": tool_count,
+        "runs": args.runs,
+        "steps": steps,
+        # Runs whose history was truncated, 0 means truncate never dropped anything
+        "truncated_runs": truncated_runs,
+        "model_time_s": model_time,
+        "wall_time_s": wall_time,
+        "overhead_per_step_ms": {
+            "mean": overhead / steps * 1000 if steps else 0.0,
+            "p50": percentile(step_overheads, 50) * 1000,
+            "p95": percentile(step_overheads, 95) * 1000,
+            "stdev": statistics.pstdev(step_overheads) * 1000 if step_overheads else 0.0,
+        },
+        "phase_per_step_ms": {
+            **{phase: seconds / steps * 1000 for phase, seconds in sorted(phases.items())},
+            # Loop bookkeeping, history appends, logging...
+            "other": (overhead - measured) / steps * 1000 if steps else 0.0,
+        },
+    }
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    transcripts = DEFAULT_TRANSCRIPTS
+    if args.transcripts:
+        with open(args.transcripts, encoding="utf-8") as f:
+            transcripts = json.load(f)["transcripts"]
+
+    timer = PhaseTimer()
+    instrument(timer)
+
+    results = []
+    for history_length in args.history_lengths:
+        for tool_count in args.tool_counts:
+            result = await run_config(args, timer, transcripts, history_length, max(1, tool_count))
+            results.append(result)
+            logger.warning(
+                f"history={history_length} tools={tool_count}: "
+                f"{result['overhead_per_step_ms']['mean']:.3f} ms overhead per step"
+            )
+
+    return {
+        "latency_s": args.latency,
+        "chunk_delay_s": args.chunk_delay,
+        "chunk_size": args.chunk_size,
+        "context_window": args.context_window,
+        "transcripts": len(transcripts),
+        "results": results,
+    }
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deterministic replay benchmark for ReActAgent")
+    parser.add_argument("--transcripts", help="JSON transcripts to replay, see module docstring")
+    parser.add_argument("--history-lengths", type=_int_list, default=[0, 10, 100], help="Earlier turns in history, comma separated")
+    parser.add_argument("--tool-counts", type=_int_list, default=[1, 10, 50], help="Registered tools, comma separated")
+    parser.add_argument("--runs", type=int, default=50, help="Questions per configuration")
+    parser.add_argument("--warmup", type=int, default=3, help="Questions run before measuring")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated time to first token in seconds")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Simulated delay between stream chunks")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per stream chunk")
+    parser.add_argument(
+        "--context-window", type=int, default=ModelConfig().context_window_size,
+        help="Model context window in tokens, ModelConfig's by default, lower it to exercise truncation",
+    )
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    # Per-message logs would dominate the measurement
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    report = asyncio.run(run_benchmark(args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
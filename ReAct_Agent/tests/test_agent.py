@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent import ModelConfig, ReActAgent
+from tools import FakeGetWeather
+from utils.history_util import MessageHistory
+
+
+class FakeClient:
+    """Streams one scripted response per model call and records the requests"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages, **kwargs):
+        self.requests.append([dict(message) for message in messages])
+        text = self.responses.pop(0)
+
+        async def chunks():
+            for start in range(0, len(text), 8):
+                delta = SimpleNamespace(content=text[start:start + 8])
+                yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+            usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+            yield SimpleNamespace(usage=usage, choices=[])
+
+        return chunks()
+
+
+def test_question_is_kept_in_second_request_with_default_config():
+    client = FakeClient([
+        'Thought: I need the weather.\nAction: get_weather(city="Tokyo")\n',
+        "Thought: I have it.\nAnswer: It is sunny in Tokyo.",
+    ])
+    agent = ReActAgent("Test Agent", tools=[FakeGetWeather()], config=ModelConfig(), client=client)
+
+    answer = asyncio.run(agent.run_async("What is the weather in Tokyo?"))
+
+    assert answer == "It is sunny in Tokyo."
+    second = [message["content"] for message in client.requests[1]]
+    assert "Question: What is the weather in Tokyo?" in second
+    assert any('Action: get_weather(city="Tokyo")' in content for content in second)
+    assert second[-1].startswith("Observation:")
+
+
+def test_truncate_drops_whole_earlier_turns_only():
+    history = MessageHistory(model="gpt-4o", system="You are a test agent", context_window_size=10**6)
+
+    async def fill():
+        for turn in range(3):
+            await history.add_message("user", f"Question: question {turn}")
+            await history.add_message("assistant", f"Action: lookup(turn={turn})")
+            await history.add_message("user", f"Observation: result {turn}")
+            await history.add_message("assistant", f"Answer: answer {turn}")
+        await history.add_message("user", "Question: current question")
+        await history.add_message("assistant", "Action: lookup(turn=3)")
+        await history.add_message("user", "Observation: result 3")
+
+        history.context_window_size = history.system_tokens + sum(history.message_tokens[-3:]) + history.truncation_tokens
+        await history.truncate()
+
+    asyncio.run(fill())
+
+    contents = [message["content"] for message in history.format_for_api()[1:]]
+    assert contents == [
+        "[Earlier history has been truncated]",
+        "Question: current question",
+        "Action: lookup(turn=3)",
+        "Observation: result 3",
+    ]
+    assert history.total_tokens == history.system_tokens + history.truncation_tokens + sum(history.message_tokens)
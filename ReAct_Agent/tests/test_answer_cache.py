@@ -0,0 +1,37 @@
+import pytest
+
+from utils.answer_cache import AnswerCache, literal_key, normalize_question
+
+
+@pytest.mark.parametrize(
+    "cached, asked",
+    [
+        ("What is 3 * 4?", "What is 4 / 3?"),
+        ("convert 100 usd to eur", "convert 100 eur to usd"),
+        ("What is 3 + 4?", "What is 3 - 4?"),
+        ("What is 2.5 * 4?", "What is 25 * 4?"),
+    ],
+)
+def test_different_numbers_operators_or_units_miss(cached, asked):
+    cache = AnswerCache()
+    cache.set(cached, "cached answer", [], [])
+    assert cache.get(asked) is None
+
+
+def test_near_duplicate_question_hits():
+    cache = AnswerCache()
+    cache.set("weather in Tokyo?", "Sunny", [], ["get_weather"])
+    entry = cache.get("what's Tokyo's weather")
+    assert entry is not None and entry.answer == "Sunny"
+
+
+def test_same_literals_with_different_wording_hits():
+    cache = AnswerCache()
+    cache.set("What is 3 * 4?", "12", [], [])
+    assert cache.get("what is 3*4") is not None
+
+
+def test_normalization_keeps_operators_and_decimals():
+    normalized = normalize_question("What's 3.5 * (4 - 1)?")
+    assert normalized == "what s 3.5 * 4 - 1"
+    assert literal_key(normalized) == ("3.5", "*", "4", "-", "1")
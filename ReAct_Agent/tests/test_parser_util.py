@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from utils.parser_util import ReActStreamParser, parse_action_line
+from utils.tool_util import execute_tools
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        'Action: get_weather(city="Tokyo"), get_weather(city="Paris")',
+        "Action: f(x={[1]: 2})",
+        "Action: f(**{'x': 1})",
+    ],
+)
+def test_invalid_arguments_become_a_parse_error(line):
+    parser = ReActStreamParser()
+    actions = parser.feed(line + "\n")
+    assert len(actions) == 1
+    assert actions[0]["args"] == {}
+    assert "error" in actions[0]
+
+
+def test_parse_error_is_reported_as_observation():
+    action = parse_action_line('Action: get_weather(city="Tokyo"), get_weather(city="Paris")')
+    results = asyncio.run(execute_tools([action], {}))
+    assert results[0]["content"].startswith("Could not parse action get_weather:")
+
+
+def test_valid_arguments_are_typed():
+    action = parse_action_line('Action: calculate(values=[1, 2.5], exact=True, label="sum")')
+    assert action == {"name": "calculate", "args": {"values": [1, 2.5], "exact": True, "label": "sum"}}
+
+
+def test_non_python_arguments_fall_back_to_string_pairs():
+    action = parse_action_line('Action: get_weather(city="Tokyo" unit="C")')
+    assert action["args"] == {"city": "Tokyo", "unit": "C"}
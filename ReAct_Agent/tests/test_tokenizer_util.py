@@ -0,0 +1,24 @@
+import asyncio
+import threading
+
+from utils import tokenizer_util
+from utils.tokenizer_util import TokenizerRegistry
+
+
+def test_warm_loads_encoding_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def get_encoding(name):
+        threads.append(threading.current_thread())
+        return object()
+
+    monkeypatch.setattr(tokenizer_util.tiktoken, "get_encoding", get_encoding)
+    registry = TokenizerRegistry()
+    assert not registry.is_loaded("gpt-4o")
+
+    asyncio.run(registry.warm("gpt-4o"))
+    asyncio.run(registry.warm("gpt-4o"))
+
+    assert registry.is_loaded("gpt-4o")
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
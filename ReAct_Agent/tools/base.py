@@ -10,6 +10,8 @@ class Tool:
     name:str
     description:str
     input_schema:Dict[str, Any]
+    # Seconds an answer that used this tool may stay in the answer cache, 0 to never cache it
+    cache_ttl:float = 300.0
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for Model Input"""
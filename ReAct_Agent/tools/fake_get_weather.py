@@ -1,6 +1,6 @@
 """Fake Tool for getting weather for simplicity"""
 
-from base import Tool
+from .base import Tool
 
 class FakeGetWeather(Tool):
     """Fake Tool for getting weather for simplicity"""
@@ -15,7 +15,8 @@ class FakeGetWeather(Tool):
                     "city": {"type": "string", "description": "The city to get the weather for"},
                 },
                 "required": ["city"],
-            }
+            },
+            cache_ttl=600.0,
         )
 
     async def execute(self, city: str) -> str:
@@ -1,4 +1,7 @@
 from .history_util import MessageHistory
 from .tool_util import execute_tools
+from .parser_util import ReActStreamParser, STOP_SEQUENCES, parse_actions, format_observation
+from .tokenizer_util import configure_tokenizers, count_tokens
+from .answer_cache import AnswerCache, Embedder, HashingEmbedder
 
-__all__ = ["MessageHistory", "execute_tools"]
\ No newline at end of file
+__all__ = ["MessageHistory", "execute_tools", "ReActStreamParser", "STOP_SEQUENCES", "parse_actions", "format_observation", "configure_tokenizers", "count_tokens", "AnswerCache", "Embedder", "HashingEmbedder"]
\ No newline at end of file
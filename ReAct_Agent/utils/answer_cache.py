@@ -0,0 +1,198 @@
+"""Semantic answer cache for ReAct Agent
+
+Near-duplicate questions ("weather in Tokyo?", "what's Tokyo's weather") are
+answered from the cache without running the Thought/Action loop again
+"""
+
+import hashlib
+import math
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+
+# Words that don't change what is asked; time words like "today" are kept on purpose
+STOP_WORDS = {
+    "a", "about", "an", "and", "are", "at", "can", "could", "do", "does", "for", "how",
+    "i", "in", "is", "it", "like", "me", "of", "on", "please", "s", "tell", "the",
+    "to", "what", "whats", "you",
+}
+
+# Units and currencies, their order decides what is asked ("usd to eur" vs "eur to usd")
+UNITS = {
+    "usd", "eur", "jpy", "gbp", "cny", "chf", "cad", "aud", "krw", "inr", "btc",
+    "dollar", "dollars", "euro", "euros", "yen", "pound", "pounds",
+    "c", "f", "k", "celsius", "fahrenheit", "kelvin",
+    "mm", "cm", "m", "km", "ft", "yd", "mi", "inch", "inches", "foot", "feet", "mile", "miles",
+    "mg", "g", "kg", "lb", "lbs", "oz", "ml", "l", "gal",
+    "sec", "min", "h", "hr", "hour", "hours", "day", "days", "kmh", "mph",
+    "percent",
+}
+OPERATORS = "+-*/^%=<>"
+
+def normalize_question(question: str) -> str:
+    """Lowercase words, numbers and operators, so punctuation and spacing don't matter"""
+    return " ".join(re.findall(r"[a-z0-9]+(?:\.[0-9]+)?|[+\-*/^%=<>]", question.lower()))
+
+def literal_key(normalized: str) -> Tuple[str, ...]:
+    """Numbers, operators and units of a normalized question, in order
+
+    Questions differing only there ("3 * 4" and "4 / 3") embed almost the
+    same, so a cached answer is only reused when this key is equal
+    """
+    return tuple(
+        token for token in normalized.split()
+        if token in OPERATORS or token in UNITS or any(char.isdigit() for char in token)
+    )
+
+class Embedder(ABC):
+    """Turn a normalized question into a unit-length vector"""
+
+    @abstractmethod
+    def embed(self, text: str) -> List[float]:
+        """Embedding of a normalized question"""
+
+class HashingEmbedder(Embedder):
+    """Local, dependency-free embedder using feature hashing
+
+    Features are the content words, their character trigrams (so "tokyo" and
+    "tokyos" stay close) and word bigrams (so word order still counts a little)
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = [word for word in text.split() if word not in STOP_WORDS]
+        features = []
+        for word in words:
+            features.append((f"w:{word}", 1.0))
+            padded = f"#{word}#"
+            trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            features.extend((f"c:{trigram}", 0.5 / math.sqrt(len(trigrams))) for trigram in trigrams)
+        features.extend((f"b:{first} {second}", 0.5) for first, second in zip(words, words[1:]))
+        return features
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for feature, weight in self._features(text):
+            # blake2b rather than hash(), which is salted per process
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += weight if (digest >> 32) & 1 else -weight
+
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+@dataclass
+class CachedAnswer:
+    """Final answer of a question with the trajectory that produced it"""
+
+    question: str
+    embedding: List[float]
+    answer: str
+    trajectory: List[Dict[str, Any]]
+    tools: List[str]
+    expires_at: float
+    literals: Tuple[str, ...] = ()
+    hits: int = 0
+
+class AnswerCache:
+    """LRU cache of answers looked up by question similarity
+
+    Each answer expires after the TTL of the tools it depended on, so an
+    answer built from a weather lookup doesn't outlive the weather
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder | None = None,
+        threshold: float = 0.9,
+        max_size: int = 1024,
+        default_ttl: float = 3600.0,
+    ):
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.max_size = max_size
+        # TTL of answers that didn't use any tool
+        self.default_ttl = default_ttl
+        self.entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # get and set usually embed the same question back to back
+        self._last_embedding: Tuple[str, List[float]] | None = None
+
+    def _embed(self, normalized: str) -> List[float]:
+        if self._last_embedding is None or self._last_embedding[0] != normalized:
+            self._last_embedding = (normalized, self.embedder.embed(normalized))
+        return self._last_embedding[1]
+
+    def get(self, question: str) -> CachedAnswer | None:
+        """Cached answer of the most similar question above the threshold"""
+        normalized = normalize_question(question)
+        now = time.time()
+
+        for key in [key for key, entry in self.entries.items() if entry.expires_at <= now]:
+            del self.entries[key]
+
+        # An identical normalized question needs no embedding
+        key = normalized if normalized in self.entries else None
+        literals = literal_key(normalized)
+        candidates = [
+            (entry_key, entry) for entry_key, entry in self.entries.items() if entry.literals == literals
+        ]
+        if key is None and candidates:
+            embedding = self._embed(normalized)
+            score, key = max(
+                (sum(a * b for a, b in zip(embedding, entry.embedding)), entry_key)
+                for entry_key, entry in candidates
+            )
+            if score < self.threshold:
+                key = None
+
+        if key is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        entry = self.entries[key]
+        entry.hits += 1
+        self.hits += 1
+        logger.debug(f"Answer cache hit for {question!r}: {entry.question!r}")
+        return entry
+
+    def set(
+        self,
+        question: str,
+        answer: str,
+        trajectory: List[Dict[str, Any]],
+        tools: List[str],
+        ttl: float | None = None,
+    ) -> None:
+        """Cache an answer, ttl is the smallest TTL of the tools it used"""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        normalized = normalize_question(question)
+        self.entries[normalized] = CachedAnswer(
+            question=question,
+            embedding=self._embed(normalized),
+            answer=answer,
+            trajectory=trajectory,
+            tools=tools,
+            expires_at=time.time() + ttl,
+            literals=literal_key(normalized),
+        )
+        self.entries.move_to_end(normalized)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached answer"""
+        self.entries.clear()
+        self._last_embedding = None
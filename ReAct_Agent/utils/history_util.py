@@ -1,11 +1,20 @@
 """History Utility for ReAct Agent with Token tracking"""
 
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any
 from loguru import logger
-import tiktoken
+
+from .tokenizer_util import count_tokens
+
+# Tokens the chat format adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_NOTICE_MESSAGE = {"role": "user", "content": "[Earlier history has been truncated]"}
 
 class MessageHistory:
-    """Manage Chat History with token tracking and context management"""
+    """Manage Chat History with token tracking and context management
+
+    context_window_size is the token budget of the prompt sent to the model,
+    system prompt included, so the model's context size minus max_tokens
+    """
 
     def __init__(
         self,
@@ -16,23 +25,23 @@ class MessageHistory:
         self.model = model
         self.system = system
         self.context_window_size = context_window_size
-        self.total_tokens = 0
         self.messages: List[Dict[str, Any]] = []
-        self.message_tokens: List[Tuple[int, int]] = []
-
-        # model = gpt-4o for example
-        encoding = tiktoken.encoding_for_model(model)
+        # Local token count of each message, in the same order
+        self.message_tokens: List[int] = []
+        self.truncated = False
+        # Last usage reported by the API, for reference only
+        self.last_usage: Any = None
+
+        # model = gpt-4o for example, unknown names use the registry default encoding
+        self.system_tokens = self._count(system)
+        self.truncation_tokens = self._count(TRUNCATION_NOTICE_MESSAGE["content"])
+        # Tokens of the prompt format_for_api returns
+        self.total_tokens = self.system_tokens
+        logger.info(f"Message History Initialized")
 
-        try:
-            system_tokens = len(encoding.encode(system))
-        except Exception:
-            logger.warning(f"Failed to encode system prompt for {model}. Using approximate token count.")
-            system_tokens = len(system)/4
+    def _count(self, content: str) -> int:
+        return count_tokens(content, self.model) + MESSAGE_OVERHEAD_TOKENS
 
-        self.system_tokens = system_tokens
-        self.encoding = encoding
-        logger.info(f"Message History Initialized")
-    
     async def add_message(self, role: str, content: str, usage: Any = None) -> None:
         """Add a message to the history"""
         # Depends on Model, we may need to rewrite partly for this part if using multimodal model
@@ -41,43 +50,45 @@ class MessageHistory:
 
         self.messages.append({"role": role, "content": content})
 
-        # For token tracking
-        if role == "assistant" and usage:
-            total_input = usage.prompt_tokens
-            output_tokens = usage.completion_tokens
+        # Counted locally, so the prompt size is known before it is sent
+        tokens = self._count(content)
+        self.message_tokens.append(tokens)
+        self.total_tokens += tokens
+
+        if usage:
+            self.last_usage = usage
 
-            current_input_tokens = total_input - self.total_tokens
-            self.message_token.append((current_input_tokens, output_tokens))
-            self.total_tokens += current_input_tokens + output_tokens
+    @staticmethod
+    def _is_question(message: Dict[str, Any]) -> bool:
+        return message["role"] == "user" and message["content"].startswith("Question:")
 
     async def truncate(self) -> None:
-        """Truncate the history to the context window size when exceed"""
-        if self.total_tokens < self.context_window_size:
-            return
-        
-        TRUNCATION_NOTICE_TOKEN = 7
-        TRUNCATION_NOTICE_MESSAGE = "[Earlier history has been truncated]"
-        
-        def remove_message_pair():
-            self.messages.pop(0)
-            self.messages.pop(0)
-
-            if self.message_tokens:
-                input_tokens, output_tokens = self.message_tokens.pop(0)
-                self.total_tokens -= input_tokens + output_tokens
-
-        while (
-            self.message_tokens and
-            self.total_tokens > self.context_window_size and 
-            len(self.messages) >= 2
-        ):
-            remove_message_pair()
-
-            if self.messages and self.message_tokens:
-                original_input_tokens, original_output_tokens = self.message_tokens[0]
-                self.messages[0] = TRUNCATION_NOTICE_MESSAGE
-                self.message_tokens[0] = (TRUNCATION_NOTICE_TOKEN, original_output_tokens)
-                self.total_tokens += TRUNCATION_NOTICE_TOKEN - original_input_tokens
+        """Drop the oldest turns while the prompt exceeds the context window size
+
+        A turn is a Question with its Actions, Observations and Answer. Whole
+        turns are dropped, and never the current one, so the model always sees
+        the question it is answering and the Action each Observation answers
+        """
+        while self.total_tokens > self.context_window_size:
+            # The oldest turn ends where the next Question starts
+            end = next(
+                (i for i in range(1, len(self.messages)) if self._is_question(self.messages[i])),
+                None,
+            )
+            if end is None:
+                logger.warning(
+                    f"Current turn alone is {self.total_tokens} tokens, "
+                    f"over the {self.context_window_size} token context window"
+                )
+                return
+
+            self.total_tokens -= sum(self.message_tokens[:end])
+            del self.messages[:end]
+            del self.message_tokens[:end]
+
+            if not self.truncated:
+                self.truncated = True
+                self.total_tokens += self.truncation_tokens
 
     def format_for_api(self) -> List[Dict[str, Any]]:
         """Format the history for API call"""
@@ -85,5 +96,7 @@ class MessageHistory:
             {"role": m["role"], "content": m["content"]} for m in self.messages
         ]
 
+        if self.truncated:
+            result.insert(0, dict(TRUNCATION_NOTICE_MESSAGE))
         result.insert(0, {"role": "system", "content": self.system})
-        return result    
\ No newline at end of file
+        return result
@@ -0,0 +1,118 @@
+"""Incremental parser for streamed ReAct responses"""
+
+import ast
+import re
+from typing import Any, Dict, List
+
+# Stop generation before the model invents its own Observation
+STOP_SEQUENCES = ["Observation:"]
+
+ACTION_PATTERN = re.compile(r"^\s*Action:\s*([\w_]+)\s*\((.*)\)\s*$")
+ACTION_ARGS_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+ANSWER_PATTERN = re.compile(r"Answer:\s*(.*)", re.S)
+
+class ActionParseError(ValueError):
+    """Arguments of an Action line that can't be turned into a tool call"""
+
+def _parse_arguments(arguments: str) -> Dict[str, Any]:
+    """Keyword arguments of one action, typed as Python literals (numbers, lists, booleans...)
+
+    Falls back to key="value" string pairs if the arguments are not valid Python,
+    raises ActionParseError if they are but don't form one call with keyword arguments
+    """
+    try:
+        call = ast.parse(f"f({arguments})", mode="eval").body
+    except (SyntaxError, ValueError):
+        return dict(ACTION_ARGS_PATTERN.findall(arguments))
+    except Exception as e:
+        raise ActionParseError(f"invalid arguments: {e}") from e
+
+    # `a(x=1), b(y=2)` on one line parses as a tuple of calls
+    if not isinstance(call, ast.Call) or any(keyword.arg is None for keyword in call.keywords):
+        raise ActionParseError("expected a single call with keyword arguments, write one Action per line")
+
+    try:
+        return {keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords}
+    except ValueError:
+        return dict(ACTION_ARGS_PATTERN.findall(arguments))
+    except Exception as e:
+        # e.g. TypeError for an unhashable dict key
+        raise ActionParseError(f"invalid arguments: {e}") from e
+
+def parse_action_line(line: str) -> Dict[str, Any] | None:
+    """Parse `Action: name(key="value", ...)` into a tool call, None if the line is not an action
+
+    Arguments are only taken from this line, so several actions in one step don't mix.
+    Invalid arguments give a call with an "error" key, reported back as its observation
+    """
+    if not (match := ACTION_PATTERN.match(line)):
+        return None
+
+    function_name, arguments = match.groups()
+    try:
+        return {
+            "name": function_name,
+            "args": _parse_arguments(arguments),
+        }
+    except ActionParseError as e:
+        return {
+            "name": function_name,
+            "args": {},
+            "error": str(e),
+        }
+
+def parse_actions(response: str) -> List[Dict[str, Any]]:
+    """Every action of a complete response, in order"""
+    return [action for line in response.splitlines() if (action := parse_action_line(line)) is not None]
+
+def format_observation(actions: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> str:
+    """Observation message for the results of one step, labelled per action when there are several"""
+    if len(actions) == 1:
+        return f"Observation: {results[0]['content']}"
+
+    lines = ["Observation:"]
+    for i, (action, result) in enumerate(zip(actions, results), start=1):
+        arguments = ", ".join(f"{key}={value!r}" for key, value in action["args"].items())
+        lines.append(f"[{i}] {action['name']}({arguments}): {result['content']}")
+    return "\n".join(lines)
+
+class ReActStreamParser:
+    """Consume a streamed response and report each Action as soon as its line is complete"""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._line = ""
+        self.actions: List[Dict[str, Any]] = []
+
+    @property
+    def text(self) -> str:
+        """Full response received so far"""
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """Add a streamed fragment, return the actions completed by it"""
+        self._parts.append(delta)
+        self._line += delta
+
+        completed = []
+        while "\n" in self._line:
+            line, self._line = self._line.split("\n", 1)
+            if (action := parse_action_line(line)) is not None:
+                completed.append(action)
+
+        self.actions.extend(completed)
+        return completed
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """End of stream, the last line is complete too"""
+        line, self._line = self._line, ""
+        if (action := parse_action_line(line)) is None:
+            return []
+        self.actions.append(action)
+        return [action]
+
+    def answer(self) -> str | None:
+        """Final answer of the response, if it has one"""
+        if (match := ANSWER_PATTERN.search(self.text)) is None:
+            return None
+        return match.group(1).strip()
@@ -13,6 +13,10 @@ async def _execute_tool(tool_call: Dict[str, Any], tool_dict: Dict[str, Any]) ->
         "content" : ""
     }
 
+    if "error" in tool_call:
+        response["content"] = f"Could not parse action {tool_call['name']}: {tool_call['error']}"
+        return response
+
     try:
         result = await tool_dict[tool_call["name"]].execute(**tool_call["args"])
         response["content"] = result